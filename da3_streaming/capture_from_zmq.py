@@ -1,12 +1,12 @@
 # coding=utf-8
 import argparse
-import base64
-import json
 
 import cv2
-import numpy as np
 import zmq
 
+from loop_utils.jpeg_utils import decode_jpeg
+from loop_utils.zmq_utils import unpack_frame_message
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -45,23 +45,16 @@ def main():
     socket.setsockopt(zmq.RCVTIMEO, args.timeout)
 
     try:
-        # 接收一条消息（字符串）
-        msg_str = socket.recv_string()
+        # 接收一条多帧消息: [时间戳, JPEG字节]
+        parts = socket.recv_multipart(copy=False)
         print("Message received from publisher.")
 
-        # 解析 JSON
-        data = json.loads(msg_str)
-        timestamp = data.get("timestamp", None)
-        img_b64 = data["image"]
-
-        # base64 -> bytes
-        img_bytes = base64.b64decode(img_b64)
-
-        # bytes -> numpy 数组 -> OpenCV 图像
-        img_array = np.frombuffer(img_bytes, dtype=np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        timestamp, img_bytes = unpack_frame_message(parts)
 
-        if img is None:
+        # bytes -> OpenCV 图像（libjpeg-turbo 解码）
+        try:
+            img = decode_jpeg(img_bytes)
+        except ValueError:
             print("解码 JPEG 失败，未能获得有效图像。")
             return
 
@@ -4,28 +4,55 @@ DA3 实时处理服务
 提供REST API和WebSocket接口，支持实时视频流处理和点云渲染
 """
 import argparse
-import base64
-import json
 import os
 import threading
 import time
 from datetime import datetime
 from pathlib import Path
-from queue import Queue
+from queue import Empty, Full, Queue
+
+try:
+    # SIMD加速的base64（libbase64），未安装时回退到标准库
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-import cv2
-import numpy as np
 import zmq
-from flask import Flask, jsonify, render_template, request, send_file
+from flask import Flask, jsonify, render_template, request, send_from_directory
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 
 from loop_utils.config_utils import load_config
+from loop_utils.frame_store import FrameStore
+from loop_utils.jpeg_utils import decode_jpeg_thumbnail, encode_jpeg
+from loop_utils.zmq_utils import unpack_frame_message
 from da3_streaming_realtime import DA3_Streaming_Realtime
 
 app = Flask(__name__)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+
+
+class OrjsonSerializer:
+    """socket.io数据包的JSON编解码，使用orjson（接口与标准库json兼容）"""
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
+
+socketio_options = {}
+if orjson is not None:
+    socketio_options['json'] = OrjsonSerializer
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', **socketio_options)
 
 # 全局状态
 class StreamingState:
@@ -36,22 +63,113 @@ class StreamingState:
         self.chunk_count = 0
         self.status = "idle"  # idle, capturing, processing, finalizing, loop_closure, finished
         self.da3_processor = None
+        self.frame_store = None
         self.zmq_thread = None
         self.processing_thread = None  # 添加处理线程引用
-        self.frame_queue = Queue()
+        self.frame_cv = threading.Condition()  # 帧数达到水位线/停止时唤醒处理线程
+        self.required_frames = 0  # 处理线程等待的帧数水位线
         self.output_dir = None
         self.config = None
+        self.chunk_size = 0
+        self.overlap = 0
+        self.step = 0  # chunk_size - overlap
         self.default_config_path = "./configs/realtime_config.yaml"  # 默认配置文件路径
         self.zmq_host = "127.0.0.1"
         self.zmq_port = 5555
+        self.zmq_rcvhwm = 4  # SUB接收队列上限（消息数），超出后丢弃新到的帧
         
 state = StreamingState()
 
+# 后台线程发出的事件统一入队，由单独的发送任务推送到websocket，
+# 慢客户端只会阻塞发送任务，不会阻塞采集/处理线程
+# 必须送达的事件（chunk_ready、loop_closure_finished 等）不设上限，永不丢弃也不阻塞；
+# 高频的可丢弃事件在队列中最多积压 EMIT_MAX_DROPPABLE 条，超出时直接丢弃新的
+emit_queue = Queue()
+EMIT_MAX_DROPPABLE = 256
+_droppable_pending = 0  # 队列中尚未发送的可丢弃事件数
+_droppable_lock = threading.Lock()
+_emit_worker_started = False
+_emit_worker_lock = threading.Lock()
+
+
+def _ensure_emit_worker():
+    """第一次发送事件时启动发送任务（不依赖 __main__，以其他方式运行app时同样生效）"""
+    global _emit_worker_started
+    if _emit_worker_started:
+        return
+    with _emit_worker_lock:
+        if not _emit_worker_started:
+            socketio.start_background_task(emit_worker)
+            _emit_worker_started = True
+
+
+def emit_async(event, data, droppable=False):
+    """从后台线程发送事件到前端（不阻塞调用线程）
+    
+    Args:
+        event: 事件名
+        data: 事件数据
+        droppable: 积压过多时是否可以丢弃（用于高频的状态更新）
+    """
+    global _droppable_pending
+    _ensure_emit_worker()
+    if droppable:
+        with _droppable_lock:
+            if _droppable_pending >= EMIT_MAX_DROPPABLE:
+                return
+            _droppable_pending += 1
+    emit_queue.put((event, data, droppable))
+
+
+def emit_worker():
+    """事件发送任务"""
+    global _droppable_pending
+    while True:
+        event, data, droppable = emit_queue.get()
+        if droppable:
+            with _droppable_lock:
+                _droppable_pending -= 1
+        try:
+            socketio.emit(event, data)
+        except Exception as e:
+            print(f"Error emitting {event}: {e}")
+
+
+def estimate_remaining_chunks(frame_count, processed_frames, chunk_count, chunk_size, step):
+    """估算剩余待处理的chunk数量
+    
+    第一个chunk需要 chunk_size 帧，之后每个chunk处理 chunk_size - overlap 的新帧
+    
+    Args:
+        frame_count: 已捕获的总帧数
+        processed_frames: 已处理到的帧位置
+        chunk_count: 已处理的chunk数
+        chunk_size: 每个chunk的帧数
+        step: 每个新chunk推进的帧数（chunk_size - overlap）
+    """
+    if chunk_count == 0:
+        # 第一个chunk还未处理
+        if frame_count <= 0:
+            return 0
+        return max(0, int((frame_count - chunk_size) / step) + 1)
+    return max(0, int((frame_count - processed_frames) / step))
+
+
+CAPTURE_LOG_INTERVAL = 30  # 采集日志的打印间隔（帧）
+
+# 进程内共享的ZMQ上下文，多次start/stop复用，不重复创建IO线程
+_ZMQ_CTX = zmq.Context.instance(io_threads=1)
 
-def zmq_capture_thread(host, port):
+
+def zmq_capture_thread(host, port, rcvhwm):
     """ZMQ视频流接收线程"""
-    context = zmq.Context()
-    socket = context.socket(zmq.SUB)
+    socket = _ZMQ_CTX.socket(zmq.SUB)
+    # 接收端积压上限：消费变慢时丢帧而不是无限缓存，保证延迟和内存有界
+    # （ZMQ_CONFLATE 不支持多帧消息，这里只能用HWM）。需在connect之前设置
+    socket.setsockopt(zmq.RCVHWM, rcvhwm)
+    # 关闭时丢弃未处理的消息，不阻塞stop
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.setsockopt(zmq.TCP_KEEPALIVE, 1)
     
     addr = f"tcp://{host}:{port}"
     print(f"Connecting to ZMQ publisher at {addr}...")
@@ -60,68 +178,108 @@ def zmq_capture_thread(host, port):
     socket.setsockopt(zmq.RCVTIMEO, 1000)  # 1秒超时
     
     frame_skip = 0  # 用于控制视频流发送频率
+    frame_store = state.frame_store
+    processor = state.da3_processor
+    
+    # 预览帧的缩放/编码/推送放在单独线程，websocket阻塞不会拖慢帧接收
+    preview_queue = Queue(maxsize=1)
+    preview_thread = threading.Thread(target=preview_emit_thread, args=(preview_queue,), daemon=True)
+    preview_thread.start()
     
     while state.is_running:
         try:
-            msg_str = socket.recv_string()
-            data = json.loads(msg_str)
-            timestamp = data.get("timestamp", time.time())
-            img_b64 = data["image"]
+            # 多帧消息: [时间戳, JPEG字节]，无需JSON和base64解码
+            timestamp, img_bytes = unpack_frame_message(socket.recv_multipart(copy=False))
+            if timestamp is None:
+                timestamp = time.time()
             
-            # 解码图像
-            img_bytes = base64.b64decode(img_b64)
-            img_array = np.frombuffer(img_bytes, dtype=np.uint8)
-            img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+            # 收到的已是JPEG，直接追加到帧存储，避免解码+重新编码和逐帧建文件
+            frame_store.append(img_bytes)
             
-            if img is not None:
-                # 保存到临时目录
-                frame_path = os.path.join(
-                    state.output_dir, "frames", f"frame_{state.frame_count:06d}.jpg"
-                )
-                cv2.imwrite(frame_path, img)
-                
-                state.frame_count += 1
-                state.frame_queue.put(frame_path)
-                
-                # 每5帧发送一次视频预览到前端（降低带宽消耗）
-                if frame_skip % 5 == 0:
-                    # 缩小图像用于预览
-                    preview_img = cv2.resize(img, (320, 240))
-                    _, buffer = cv2.imencode('.jpg', preview_img, [cv2.IMWRITE_JPEG_QUALITY, 60])
-                    preview_b64 = base64.b64encode(buffer).decode('utf-8')
-                    
-                    # 发送视频预览帧
-                    socketio.emit('video_frame', {
-                        'frame': preview_b64,
-                        'frame_count': state.frame_count,
-                        'timestamp': timestamp
-                    })
-                
-                frame_skip += 1
-                
-                # 发送状态更新到前端
-                socketio.emit('frame_captured', {
-                    'frame_count': state.frame_count,
-                    'timestamp': timestamp
-                })
-                
+            state.frame_count += 1
+            # 提交后台预解码（环形缓存满时自动停止，不阻塞接收）
+            processor.prefetch_frames(state.frame_count)
+            # 只在帧数达到处理线程的水位线时唤醒它
+            if state.frame_count >= state.required_frames:
+                with state.frame_cv:
+                    state.frame_cv.notify()
+            
+            # 每5帧发送一次视频预览到前端（降低带宽消耗）
+            if frame_skip % 5 == 0:
+                # 交给预览线程处理；预览线程落后时丢弃旧帧，始终保留最新帧
+                preview_item = (img_bytes, state.frame_count, timestamp)
+                try:
+                    preview_queue.put_nowait(preview_item)
+                except Full:
+                    try:
+                        preview_queue.get_nowait()
+                    except Empty:
+                        pass
+                    preview_queue.put_nowait(preview_item)
+            
+            frame_skip += 1
+            
+            # 发送状态更新到前端
+            emit_async('frame_captured', {
+                'frame_count': state.frame_count,
+                'timestamp': timestamp
+            }, droppable=True)
+            
+            # 每 CAPTURE_LOG_INTERVAL 帧打印一次，避免逐帧输出拖慢采集线程
+            if state.frame_count % CAPTURE_LOG_INTERVAL == 0:
                 print(f"Captured frame {state.frame_count}")
-                
+            
         except zmq.error.Again:
             continue
         except Exception as e:
             print(f"Error in ZMQ capture: {e}")
             continue
     
+    # 共享上下文不在这里term，下次start继续使用
     socket.close()
-    context.term()
+    preview_thread.join()
+    frame_store.close()
     print("ZMQ capture thread stopped")
 
 
+def preview_emit_thread(preview_queue):
+    """视频预览线程：缩小解码、JPEG编码、base64并推送到前端"""
+    while state.is_running:
+        try:
+            img_bytes, frame_count, timestamp = preview_queue.get(timeout=0.5)
+        except Empty:
+            continue
+        
+        try:
+            # 缩小图像用于预览（DCT域缩放解码，跳过全分辨率IDCT）
+            preview_img = decode_jpeg_thumbnail(img_bytes, (320, 240))
+            buffer = encode_jpeg(preview_img, quality=60)
+            preview_b64 = base64.b64encode(buffer).decode('ascii')
+            
+            # 发送视频预览帧
+            socketio.emit('video_frame', {
+                'frame': preview_b64,
+                'frame_count': frame_count,
+                'timestamp': timestamp
+            })
+        except Exception as e:
+            print(f"Error in preview emit: {e}")
+
+
+def pointcloud_saved(chunk_id, ply_path):
+    """chunk点云PLY写入完成后通知前端（在写入完成回调的线程中调用）"""
+    emit_async('chunk_ready', {
+        'chunk_id': chunk_id,
+        'ply_path': ply_path,
+        'ply_url': f"/pointcloud/{chunk_id}"
+    })
+
+
 def da3_processing_thread():
     """DA3处理线程"""
-    chunk_size = state.config["Model"]["chunk_size"]
-    overlap = state.config["Model"]["overlap"]
+    chunk_size = state.chunk_size
+    overlap = state.overlap
+    step = state.step
     
     while True:
         # 检查是否有足够的帧来处理下一个chunk
@@ -133,27 +291,21 @@ def da3_processing_thread():
             # 已经处理的帧数存储在 da3_processor.processed_frames
             required_frames = state.da3_processor.processed_frames - overlap + chunk_size
         
-        # 当前已捕获的总帧数
+        # 当前已捕获的总帧数和捕获状态（本轮判断都基于同一份快照）
         current_total_frames = state.frame_count
+        is_running = state.is_running
         
         # 计算剩余待处理的chunk数量（估算）
-        if state.chunk_count == 0 and current_total_frames > 0:
-            # 第一个chunk还未处理
-            estimated_remaining_chunks = max(0, int((current_total_frames - chunk_size) / (chunk_size - overlap)) + 1)
-        elif state.chunk_count > 0 and hasattr(state.da3_processor, 'processed_frames'):
-            # 已处理的帧数
-            processed_frames = state.da3_processor.processed_frames
-            remaining_frames = current_total_frames - processed_frames
-            # 估算剩余chunk数（每个chunk处理 chunk_size - overlap 的新帧）
-            estimated_remaining_chunks = max(0, int(remaining_frames / (chunk_size - overlap)))
-        else:
-            estimated_remaining_chunks = 0
+        estimated_remaining_chunks = estimate_remaining_chunks(
+            current_total_frames, state.da3_processor.processed_frames,
+            state.chunk_count, chunk_size, step
+        )
         
         # 决定是否处理：
         # 1. 正常情况：有足够的帧来形成完整的chunk
         # 2. 停止捕获后：即使帧数不够，也要处理剩余的帧
         has_enough_frames = current_total_frames >= required_frames
-        has_remaining_frames = (not state.is_running and 
+        has_remaining_frames = (not is_running and 
                                state.chunk_count > 0 and 
                                hasattr(state.da3_processor, 'processed_frames') and
                                current_total_frames > state.da3_processor.processed_frames)
@@ -165,7 +317,7 @@ def da3_processing_thread():
             state.status = "processing"
             
             # 通知前端开始处理，包括剩余chunk数
-            socketio.emit('processing_started', {
+            emit_async('processing_started', {
                 'chunk_id': state.chunk_count,
                 'frame_count': state.frame_count,
                 'remaining_chunks': estimated_remaining_chunks
@@ -180,14 +332,9 @@ def da3_processing_thread():
             try:
                 ply_path = state.da3_processor.process_next_chunk(force_process=has_remaining_frames)
                 
-                if ply_path and os.path.exists(ply_path):
-                    # 读取PLY文件并发送到前端
-                    socketio.emit('chunk_ready', {
-                        'chunk_id': state.chunk_count,
-                        'ply_path': ply_path,
-                        'ply_url': f"/pointcloud/{state.chunk_count}"
-                    })
-                    print(f"Chunk {state.chunk_count} processed, PLY saved to {ply_path}")
+                if ply_path:
+                    # PLY在后台写入，写完后由 pointcloud_saved 通知前端
+                    print(f"Chunk {state.chunk_count} processed, PLY queued to {ply_path}")
                     
                     if state.is_running:
                         print(f"Next chunk will process at frame {state.da3_processor.processed_frames - overlap + chunk_size}")
@@ -210,20 +357,24 @@ def da3_processing_thread():
                 print(f"Error processing chunk: {e}")
                 import traceback
                 traceback.print_exc()
-                socketio.emit('error', {'message': str(e)})
+                emit_async('error', {'message': str(e)})
             
             state.is_processing = False
         else:
-            # 如果不需要处理，等待一会
-            time.sleep(0.1)
-            
-            # 检查退出条件：停止捕获且所有帧都已处理
-            if (not state.is_running and 
-                state.chunk_count > 0 and
-                hasattr(state.da3_processor, 'processed_frames') and
-                state.da3_processor.processed_frames >= state.frame_count):
-                print(f"All frames processed ({state.da3_processor.processed_frames}/{state.frame_count}), exiting processing thread")
+            # 检查退出条件：停止捕获后已没有可处理的帧
+            if not is_running:
+                if state.chunk_count > 0:
+                    print(f"All frames processed ({state.da3_processor.processed_frames}/{state.frame_count}), exiting processing thread")
+                else:
+                    print(f"Capture stopped before the first chunk was complete ({state.frame_count}/{chunk_size} frames), exiting processing thread")
                 break
+            
+            # 等待帧数达到下一个chunk所需的水位线，或停止信号
+            state.required_frames = required_frames
+            with state.frame_cv:
+                state.frame_cv.wait_for(
+                    lambda: state.frame_count >= required_frames or not state.is_running
+                )
     
     print("DA3 processing thread stopped")
 
@@ -244,46 +395,51 @@ def start_streaming():
         if state.processing_thread and state.processing_thread.is_alive():
             print("Waiting for old processing thread to stop...")
             state.processing_thread.join(timeout=2)
-        
-        # 清空队列中的残留数据
-        while not state.frame_queue.empty():
-            try:
-                state.frame_queue.get_nowait()
-            except:
-                break
     
     data = request.json or {}
     # 如果API请求中没有指定config，使用启动时传入的默认配置
     config_path = data.get('config', state.default_config_path)
     zmq_host = data.get('zmq_host', '127.0.0.1')
     zmq_port = data.get('zmq_port', 5555)
+    # 较小的HWM：处理跟不上时丢弃积压帧，延迟稳定；设为0表示不限制（不丢帧，但积压会无限增长）
+    zmq_rcvhwm = int(data.get('zmq_rcvhwm', state.zmq_rcvhwm))
     
     # 加载配置
     state.config = load_config(config_path)
+    # 热路径上频繁使用的模型参数缓存为属性，避免重复的两级字典查找
+    state.chunk_size = state.config["Model"]["chunk_size"]
+    state.overlap = state.config["Model"]["overlap"]
+    state.step = state.chunk_size - state.overlap
     state.zmq_host = zmq_host
     state.zmq_port = zmq_port
+    state.zmq_rcvhwm = zmq_rcvhwm
     
     # 创建输出目录
     current_datetime = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
     state.output_dir = os.path.join("./exps/realtime", current_datetime)
     os.makedirs(os.path.join(state.output_dir, "frames"), exist_ok=True)
     
+    # 帧存储：所有JPEG追加写入同一个分片文件，处理线程按索引读取
+    state.frame_store = FrameStore(os.path.join(state.output_dir, "frames"))
+    
     # 初始化DA3处理器
     state.da3_processor = DA3_Streaming_Realtime(
-        frame_dir=os.path.join(state.output_dir, "frames"),
+        frame_store=state.frame_store,
         save_dir=state.output_dir,
-        config=state.config
+        config=state.config,
+        on_pointcloud_saved=pointcloud_saved
     )
     
     # 重置状态
     state.is_running = True
     state.frame_count = 0
+    state.required_frames = state.chunk_size
     state.chunk_count = 0
     state.status = "capturing"
     state.is_processing = False
     
     # 启动线程
-    state.zmq_thread = threading.Thread(target=zmq_capture_thread, args=(zmq_host, zmq_port))
+    state.zmq_thread = threading.Thread(target=zmq_capture_thread, args=(zmq_host, zmq_port, zmq_rcvhwm))
     state.zmq_thread.start()
     
     state.processing_thread = threading.Thread(target=da3_processing_thread)
@@ -312,21 +468,16 @@ def finalize_and_loop_closure():
         print("\n[Step 1/3] Waiting for processing thread to finish remaining chunks...")
         
         # 计算估算的剩余chunk数
-        chunk_size = state.config["Model"]["chunk_size"]
-        overlap = state.config["Model"]["overlap"]
-        
-        if hasattr(state.da3_processor, 'processed_frames'):
-            processed_frames = state.da3_processor.processed_frames
-            remaining_frames = state.frame_count - processed_frames
-            estimated_remaining = max(0, int(remaining_frames / (chunk_size - overlap)))
-        else:
-            estimated_remaining = 0
+        estimated_remaining = estimate_remaining_chunks(
+            state.frame_count, state.da3_processor.processed_frames, state.chunk_count,
+            state.chunk_size, state.step
+        )
         
         print(f"  - Total frames captured: {state.frame_count}")
         print(f"  - Chunks processed: {state.chunk_count}")
         print(f"  - Estimated remaining chunks: {estimated_remaining}")
         
-        socketio.emit('processing_remaining', {
+        emit_async('processing_remaining', {
             'total_frames': state.frame_count,
             'processed_chunks': state.chunk_count,
             'remaining_chunks': estimated_remaining
@@ -343,7 +494,7 @@ def finalize_and_loop_closure():
     print(f"  - Total frames: {state.frame_count}")
     print(f"  - Frame directory: {state.output_dir}/frames")
     
-    socketio.emit('loop_closure_started', {
+    emit_async('loop_closure_started', {
         'total_chunks': state.chunk_count,
         'total_frames': state.frame_count
     })
@@ -361,7 +512,7 @@ def finalize_and_loop_closure():
         else:
             print(f"  - Warning: Final pointcloud not found at {final_ply_path}")
         
-        socketio.emit('loop_closure_finished', {
+        emit_async('loop_closure_finished', {
             'final_ply_url': f"/pointcloud/final",
             'final_ply_path': final_ply_path
         })
@@ -375,7 +526,7 @@ def finalize_and_loop_closure():
         print(f"\nERROR in loop closure: {e}")
         import traceback
         traceback.print_exc()
-        socketio.emit('error', {'message': f"Loop closure error: {str(e)}"})
+        emit_async('error', {'message': f"Loop closure error: {str(e)}"})
 
 
 @app.route('/api/stop', methods=['POST'])
@@ -386,6 +537,8 @@ def stop_streaming():
     
     state.is_running = False
     state.status = "finalizing"
+    with state.frame_cv:
+        state.frame_cv.notify_all()
     
     # 等待捕获线程结束（这个很快）
     if state.zmq_thread:
@@ -412,18 +565,10 @@ def get_status():
     # 计算剩余chunk数（如果正在运行）
     remaining_chunks = 0
     if state.config and state.da3_processor:
-        chunk_size = state.config["Model"]["chunk_size"]
-        overlap = state.config["Model"]["overlap"]
-        
-        if state.chunk_count == 0 and state.frame_count > 0:
-            # 第一个chunk还未处理
-            remaining_chunks = max(0, int((state.frame_count - chunk_size) / (chunk_size - overlap)) + 1)
-        elif state.chunk_count > 0 and hasattr(state.da3_processor, 'processed_frames'):
-            # 已处理的帧数
-            processed_frames = state.da3_processor.processed_frames
-            remaining_frames = state.frame_count - processed_frames
-            # 估算剩余chunk数
-            remaining_chunks = max(0, int(remaining_frames / (chunk_size - overlap)))
+        remaining_chunks = estimate_remaining_chunks(
+            state.frame_count, state.da3_processor.processed_frames, state.chunk_count,
+            state.chunk_size, state.step
+        )
     
     return jsonify({
         'is_running': state.is_running,
@@ -445,6 +590,8 @@ def reset_all():
     if state.is_running:
         state.is_running = False
         state.status = "finalizing"
+        with state.frame_cv:
+            state.frame_cv.notify_all()
         
         # 等待捕获线程结束
         if state.zmq_thread and state.zmq_thread.is_alive():
@@ -456,24 +603,21 @@ def reset_all():
             print("Stopping processing thread...")
             state.processing_thread.join(timeout=3)
     
-    # 清空队列
-    while not state.frame_queue.empty():
-        try:
-            state.frame_queue.get_nowait()
-        except:
-            break
-    
     # 重置所有状态变量
     state.is_running = False
     state.is_processing = False
     state.frame_count = 0
+    state.required_frames = 0
     state.chunk_count = 0
     state.status = "idle"
+    if state.da3_processor is not None:
+        state.da3_processor.close()
     state.da3_processor = None
+    state.frame_store = None
     state.zmq_thread = None
     state.processing_thread = None
     state.output_dir = None
-    # 保留 config 和 zmq_host/zmq_port，方便下次使用
+    # 保留 config 和 zmq_host/zmq_port/zmq_rcvhwm，方便下次使用
     
     # 通知前端已清空
     socketio.emit('reset_completed', {
@@ -488,6 +632,22 @@ def reset_all():
     })
 
 
+def send_pointcloud(filename):
+    """发送pcd目录下的点云文件
+    
+    支持条件请求(ETag/Last-Modified)和Range请求，文件内容由WSGI file_wrapper
+    (sendfile)发送；部署在nginx/apache后可用 --x_sendfile 交给前端服务器发送
+    """
+    pcd_dir = os.path.abspath(os.path.join(state.output_dir, "pcd"))
+    return send_from_directory(
+        pcd_dir,
+        filename,
+        mimetype='application/octet-stream',
+        conditional=True,
+        etag=True,
+    )
+
+
 @app.route('/pointcloud/<int:chunk_id>', methods=['GET'])
 def get_pointcloud(chunk_id):
     """获取指定chunk的点云文件"""
@@ -499,7 +659,7 @@ def get_pointcloud(chunk_id):
     if not os.path.exists(ply_path):
         return jsonify({'error': 'Pointcloud not found'}), 404
     
-    return send_file(ply_path, mimetype='application/octet-stream')
+    return send_pointcloud(f"{chunk_id}_pcd.ply")
 
 
 @app.route('/pointcloud/final', methods=['GET'])
@@ -513,7 +673,7 @@ def get_final_pointcloud():
     if not os.path.exists(ply_path):
         return jsonify({'error': 'Final pointcloud not found'}), 404
     
-    return send_file(ply_path, mimetype='application/octet-stream')
+    return send_pointcloud("combined_pcd.ply")
 
 
 @app.route('/')
@@ -539,13 +699,18 @@ if __name__ == '__main__':
     parser.add_argument('--port', type=int, default=5000, help='Server port')
     parser.add_argument('--config', type=str, default='./configs/realtime_config.yaml', 
                        help='Default configuration file path')
+    parser.add_argument('--x_sendfile', action='store_true',
+                       help='Serve PLY files via X-Sendfile (when running behind nginx/apache)')
     
     args = parser.parse_args()
     
+    app.config['USE_X_SENDFILE'] = args.x_sendfile
+    
     # 设置默认配置文件路径
     state.default_config_path = args.config
     
     print(f"Starting DA3 Realtime Service on {args.host}:{args.port}")
     print(f"Default config: {args.config}")
+    _ensure_emit_worker()
     socketio.run(app, host=args.host, port=args.port, debug=False)
 
@@ -3,29 +3,29 @@
 DA3 实时增量处理类
 支持增量chunk处理和最终回环优化
 """
-import glob
 import json
 import os
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import torch
-from loop_utils.alignment_torch import (
-    apply_sim3_direct_torch,
-    depth_to_point_cloud_optimized_torch,
-)
 from loop_utils.config_utils import load_config
+from loop_utils.frame_store import FrameRing
+from loop_utils.jpeg_utils import decode_jpeg
 from loop_utils.loop_detector import LoopDetector
+from loop_utils.ply_writer import PointCloudWriter
 from loop_utils.sim3loop import Sim3LoopOptimizer
 from loop_utils.sim3utils import (
-    accumulate_sim3_transforms,
+    compose_sim3,
     compute_sim3_ab,
     merge_ply_files,
     process_loop_list,
-    save_confident_pointcloud_batch,
+    select_confident_points,
     warmup_numba,
     weighted_align_point_maps,
     precompute_scale_chunks_with_depth,
@@ -37,62 +37,136 @@ from depth_anything_3.api import DepthAnything3
 matplotlib.use("Agg")
 
 
-def depth_to_point_cloud_vectorized(depth, intrinsics, extrinsics, device=None):
-    """深度图转点云（向量化版本）"""
-    input_is_numpy = False
-    if isinstance(depth, np.ndarray):
-        input_is_numpy = True
-        depth_tensor = torch.tensor(depth, dtype=torch.float32)
-        intrinsics_tensor = torch.tensor(intrinsics, dtype=torch.float32)
-        extrinsics_tensor = torch.tensor(extrinsics, dtype=torch.float32)
-        
-        if device is not None:
-            depth_tensor = depth_tensor.to(device)
-            intrinsics_tensor = intrinsics_tensor.to(device)
-            extrinsics_tensor = extrinsics_tensor.to(device)
-    else:
-        depth_tensor = depth
-        intrinsics_tensor = intrinsics
-        extrinsics_tensor = extrinsics
+_pixel_grid_cache = {}
+
+
+def get_pixel_grid(H, W, device):
+    """(H*W, 3) 的齐次像素坐标 [u, v, 1]，按 (H, W, device) 缓存"""
+    key = (H, W, str(device))
+    grid = _pixel_grid_cache.get(key)
+    if grid is None:
+        v, u = torch.meshgrid(
+            torch.arange(H, device=device, dtype=torch.float32),
+            torch.arange(W, device=device, dtype=torch.float32),
+            indexing="ij",
+        )
+        grid = torch.stack([u, v, torch.ones_like(u)], dim=-1).reshape(-1, 3)
+        _pixel_grid_cache[key] = grid
+    return grid
+
+
+def depth_to_point_cloud_vectorized(depth, intrinsics, extrinsics, device=None, out=None):
+    """深度图转点云（向量化版本），即不带sim3的 depth_to_world_sim3"""
+    return depth_to_world_sim3(depth, intrinsics, extrinsics, device=device, out=out)
+
+
+def depth_to_world_sim3(depth, intrinsics, extrinsics, s=1.0, R=None, t=None, device=None, out=None):
+    """深度图转点云并同时施加sim3变换，一遍完成
     
-    if device is not None:
-        depth_tensor = depth_tensor.to(device)
-        intrinsics_tensor = intrinsics_tensor.to(device)
-        extrinsics_tensor = extrinsics_tensor.to(device)
+    extrinsics 为 w2c 的 [R_e|t_e]，按行向量写作
+    X_world = (depth * pix @ K^-T - t_e) @ R_e = depth * (pix @ (K^-T R_e)) - t_e @ R_e，
+    每个像素只需一次3x3乘法，且无需构造4x4齐次矩阵再求逆。
+    sim3 (X' = s * X @ R^T + t) 是同样形式的仿射变换，直接并入这两项：
+    X' = depth * (pix @ (s K^-T R_e R^T)) - (s t_e @ R_e @ R^T - t)，
+    不再对整个点云单独做一遍 apply_sim3
     
-    N, H, W = depth_tensor.shape
-    device = depth_tensor.device
+    Args:
+        s, R, t: sim3，R 为 None 时不做变换
+        out: 可选的 (N, H, W, 3) float32 张量，结果直接写入其中，可跨调用复用
+    """
+    input_is_numpy = isinstance(depth, np.ndarray)
+    depth_tensor = torch.as_tensor(depth, dtype=torch.float32, device=device)
+    intrinsics_tensor = torch.as_tensor(intrinsics, dtype=torch.float32, device=device)
+    extrinsics_tensor = torch.as_tensor(extrinsics, dtype=torch.float32, device=device)
     
-    u = torch.arange(W, device=device).float().view(1, 1, W, 1).expand(N, H, W, 1)
-    v = torch.arange(H, device=device).float().view(1, H, 1, 1).expand(N, H, W, 1)
-    ones = torch.ones((N, H, W, 1), device=device)
-    pixel_coords = torch.cat([u, v, ones], dim=-1)
+    N, H, W = depth_tensor.shape
+    pixel_coords = get_pixel_grid(H, W, depth_tensor.device)
+    if out is None:
+        out = torch.empty((N, H, W, 3), dtype=torch.float32, device=depth_tensor.device)
+    points = out.view(N, H * W, 3)
     
-    intrinsics_inv = torch.inverse(intrinsics_tensor)
-    camera_coords = torch.einsum("nij,nhwj->nhwi", intrinsics_inv, pixel_coords)
-    camera_coords = camera_coords * depth_tensor.unsqueeze(-1)
-    camera_coords_homo = torch.cat([camera_coords, ones], dim=-1)
+    R_e = extrinsics_tensor[:, :3, :3]
+    t_e = extrinsics_tensor[:, :3, 3]
+    intrinsics_inv = torch.linalg.inv_ex(intrinsics_tensor)[0]
     
-    extrinsics_4x4 = torch.zeros(N, 4, 4, device=device)
-    extrinsics_4x4[:, :3, :4] = extrinsics_tensor
-    extrinsics_4x4[:, 3, 3] = 1.0
+    # 每帧 3x3 的投影矩阵和 1x3 的平移，sim3 只作用在这两个小矩阵上
+    proj = intrinsics_inv.transpose(1, 2) @ R_e
+    offset = torch.bmm(t_e[:, None, :], R_e)
+    if R is not None:
+        sim3_rot = float(s) * torch.as_tensor(R, dtype=torch.float32, device=depth_tensor.device).T
+        proj = proj @ sim3_rot
+        offset = offset @ sim3_rot - torch.as_tensor(t, dtype=torch.float32, device=depth_tensor.device)
     
-    c2w = torch.inverse(extrinsics_4x4)
-    world_coords_homo = torch.einsum("nij,nhwj->nhwi", c2w, camera_coords_homo)
-    point_cloud_world = world_coords_homo[..., :3]
+    torch.matmul(pixel_coords, proj, out=points)
+    points.mul_(depth_tensor.reshape(N, -1, 1))
+    points.sub_(offset)
     
     if input_is_numpy:
-        point_cloud_world = point_cloud_world.cpu().numpy()
+        return out.cpu().numpy()
+    return out
+
+
+# 每个chunk落盘的字段及其存储类型（每个字段一个连续的.npy，可按需mmap读取）
+# depth 单独量化为 uint16 + 每帧缩放系数，见 quantize_depth
+CHUNK_FIELDS = {
+    "conf": np.float16,
+    "extrinsics": np.float32,
+    "intrinsics": np.float32,
+    "processed_images": np.uint8,
+}
+
+
+def quantize_depth(depth):
+    """深度图 (N, H, W) 量化为 uint16，每帧按最大深度缩放
     
-    return point_cloud_world
+    与float16同样大小，但在整个深度范围内是均匀的绝对误差（max/131070），
+    对常见深度的相对误差远小于float16的约5e-4
+    
+    Returns:
+        (depth_q uint16 (N, H, W), scale float32 (N,))，depth ≈ depth_q * scale
+    """
+    depth = np.asarray(depth, dtype=np.float32)
+    scale = depth.reshape(len(depth), -1).max(axis=1) / 65535.0
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    depth_q = np.rint(np.clip(depth, 0, None) / scale[:, None, None]).astype(np.uint16)
+    return depth_q, scale
+
+
+def save_chunk_predictions(chunk_dir, predictions):
+    """将chunk预测结果按字段保存为独立的.npy文件（不pickle整个Prediction对象）"""
+    os.makedirs(chunk_dir, exist_ok=True)
+    depth_q, depth_scale = quantize_depth(predictions.depth)
+    np.save(os.path.join(chunk_dir, "depth.npy"), depth_q, allow_pickle=False)
+    np.save(os.path.join(chunk_dir, "depth_scale.npy"), depth_scale, allow_pickle=False)
+    for name, dtype in CHUNK_FIELDS.items():
+        value = getattr(predictions, name, None)
+        if value is None:
+            continue
+        np.save(os.path.join(chunk_dir, f"{name}.npy"), np.asarray(value).astype(dtype, copy=False),
+                allow_pickle=False)
 
 
 class DA3_Streaming_Realtime:
     """DA3实时流式处理"""
     
-    def __init__(self, frame_dir, save_dir, config):
+    def __init__(self, frame_store, save_dir, config, on_pointcloud_saved=None):
+        """
+        Args:
+            frame_store: 采集线程写入的帧存储（FrameStore）
+            save_dir: 输出目录
+            config: 配置
+            on_pointcloud_saved: 可选回调 (chunk_idx, ply_path)，chunk点云PLY写入完成后调用
+        """
         self.config = config
-        self.frame_dir = frame_dir
+        self.frame_store = frame_store
+        self.on_pointcloud_saved = on_pointcloud_saved
+        self.frame_dir = frame_store.frame_dir
+        # JPEG解码线程池（libjpeg-turbo/OpenCV解码时释放GIL，可多核并行）
+        self.decode_pool = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+        # 中间结果落盘放到后台线程，与下一个chunk的推理重叠
+        self.io_pool = ThreadPoolExecutor(max_workers=1)
+        # PLY序列化放到单独进程（不占用推理线程的GIL）
+        self.ply_writer = PointCloudWriter()
         self.output_dir = save_dir
         
         self.chunk_size = self.config["Model"]["chunk_size"]
@@ -100,6 +174,16 @@ class DA3_Streaming_Realtime:
         self.overlap_s = 0
         self.overlap_e = self.overlap - self.overlap_s
         
+        # 已解码帧的环形缓存（预分配），相邻chunk的重叠帧无需重复解码；
+        # 容量为两个chunk，推理当前chunk时可以提前解码下一个chunk的帧
+        self.frame_ring = FrameRing(2 * self.chunk_size)
+        # 预解码游标：[ring_tail, prefetch_head) 内的帧已提交解码，
+        # 只解码到 ring_tail + capacity 为止，仍在使用的帧不会被覆盖
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_head = 0
+        self._ring_tail = 0
+        self._prefetched = {}
+        
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.dtype = (
             torch.bfloat16 if torch.cuda.get_device_capability()[0] >= 8 else torch.float16
@@ -124,22 +208,53 @@ class DA3_Streaming_Realtime:
         self.model.load_state_dict(weight, strict=False)
         self.model.eval()
         self.model = self.model.to(self.device)
+        # 实时流中chunk大小和分辨率固定，开启cudnn自动调优（depth_anything_3.api 导入时会关闭它）
+        torch.backends.cudnn.benchmark = True
         
         # 状态变量
         self.chunk_count = 0
         self.processed_frames = 0
         self.chunk_indices = []
         self.sim3_list = []
+        self.cum_sim3 = None  # 当前chunk到第一个chunk的累积sim3
         self.all_camera_poses = []
         self.all_camera_intrinsics = []
         self.previous_chunk_data = None
+        self.prev_overlap_points = None  # 上一个chunk末尾overlap帧的点云（该chunk自身坐标系，未做sim3）
+        self._overlap_points_buf = None  # 对齐时当前chunk重叠帧点云的复用缓冲区
         
         print("DA3 Realtime Processor initialized.")
     
-    def get_available_frames(self):
-        """获取当前可用的帧"""
-        frames = sorted(glob.glob(os.path.join(self.frame_dir, "*.jpg")))
-        return frames
+    def get_num_available_frames(self):
+        """获取当前可用的帧数（帧存储索引长度，O(1)，不扫描目录）"""
+        return len(self.frame_store)
+    
+    def prefetch_frames(self, num_frames):
+        """在后台解码已到达的新帧（不阻塞，由采集线程在新帧入库后调用）
+        
+        环形缓存满时不再提交，等当前chunk处理完、ring_tail前移后再继续。
+        """
+        with self._prefetch_lock:
+            end = min(num_frames, self._ring_tail + self.frame_ring.capacity)
+            for idx in range(self._prefetch_head, end):
+                self._prefetched[idx] = self.decode_pool.submit(self._decode_frame, idx)
+            self._prefetch_head = max(self._prefetch_head, end)
+    
+    def load_frames(self, start_idx, end_idx):
+        """从帧存储中读取并解码 [start_idx, end_idx) 的帧（RGB），已预解码的帧直接取结果"""
+        with self._prefetch_lock:
+            futures = [self._prefetched.pop(idx, None) for idx in range(start_idx, end_idx)]
+        futures = [
+            future if future is not None else self.decode_pool.submit(self._decode_frame, idx)
+            for idx, future in zip(range(start_idx, end_idx), futures)
+        ]
+        return [future.result() for future in futures]
+    
+    def _decode_frame(self, idx):
+        img = self.frame_ring.get(idx)
+        if img is None:
+            img = self.frame_ring.put(idx, decode_jpeg(self.frame_store.get(idx), rgb=True))
+        return img
     
     def process_next_chunk(self, force_process=False):
         """处理下一个chunk（增量处理）
@@ -147,25 +262,25 @@ class DA3_Streaming_Realtime:
         Args:
             force_process: 是否强制处理剩余帧（即使不够一个完整的chunk）
         """
-        frames = self.get_available_frames()
+        num_frames = self.get_num_available_frames()
         
         # 计算当前chunk的范围
         if self.chunk_count == 0:
             start_idx = 0
-            end_idx = min(self.chunk_size, len(frames))
+            end_idx = min(self.chunk_size, num_frames)
             
             # 第一个chunk: 至少需要 chunk_size 帧
-            if len(frames) < self.chunk_size:
-                print(f"Waiting for more frames... (have {len(frames)}, need {self.chunk_size})")
+            if num_frames < self.chunk_size:
+                print(f"Waiting for more frames... (have {num_frames}, need {self.chunk_size})")
                 return None
         else:
             start_idx = self.processed_frames - self.overlap
-            end_idx = min(start_idx + self.chunk_size, len(frames))
+            end_idx = min(start_idx + self.chunk_size, num_frames)
             
             # 后续chunk: 需要足够的帧来形成完整的chunk
             # 但如果force_process=True，则处理所有剩余帧
             if not force_process and end_idx - start_idx < self.chunk_size:
-                print(f"Waiting for more frames... (have {len(frames)}, need {start_idx + self.chunk_size})")
+                print(f"Waiting for more frames... (have {num_frames}, need {start_idx + self.chunk_size})")
                 return None
             
             # 如果force_process=True但没有剩余帧，返回None
@@ -173,12 +288,12 @@ class DA3_Streaming_Realtime:
                 print(f"No remaining frames to process (start={start_idx}, end={end_idx})")
                 return None
         
-        chunk_frames = frames[start_idx:end_idx]
-        
-        if len(chunk_frames) == 0:
+        if end_idx <= start_idx:
             print(f"No frames to process in range [{start_idx}:{end_idx}]")
             return None
         
+        chunk_frames = self.load_frames(start_idx, end_idx)
+        
         if force_process and len(chunk_frames) < self.chunk_size:
             print(f"Processing final partial chunk {self.chunk_count}: frames [{start_idx}:{end_idx}] ({len(chunk_frames)} frames)")
         else:
@@ -187,38 +302,41 @@ class DA3_Streaming_Realtime:
         # 记录chunk范围
         self.chunk_indices.append((start_idx, end_idx))
         
-        # DA3推理
-        torch.cuda.empty_cache()
-        with torch.no_grad():
+        # DA3推理（不调用 empty_cache：chunk形状固定，缓存分配器里的显存块可以直接复用）
+        with torch.inference_mode():
             with torch.cuda.amp.autocast(dtype=self.dtype):
                 predictions = self.model.inference(
                     chunk_frames,
                     ref_view_strategy=self.config["Model"]["ref_view_strategy"]
                 )
-                
-                predictions.depth = np.squeeze(predictions.depth)
-                predictions.conf -= 1.0
         
-        torch.cuda.empty_cache()
+        # inference 返回的 depth/conf 已是 (N, H, W) 的numpy数组，原地处理即可；
+        # 不再 np.squeeze：单帧chunk时会把N维也去掉
+        predictions.conf -= 1.0
         
         # 保存未对齐的结果
-        save_path = os.path.join(self.result_unaligned_dir, f"chunk_{self.chunk_count}.npy")
+        save_path = os.path.join(self.result_unaligned_dir, f"chunk_{self.chunk_count}")
         
         # 保存相机位姿
         chunk_range = (start_idx, end_idx)
         self.all_camera_poses.append((chunk_range, predictions.extrinsics))
         self.all_camera_intrinsics.append((chunk_range, predictions.intrinsics))
         
-        np.save(save_path, predictions)
+        future = self.io_pool.submit(save_chunk_predictions, save_path, predictions)
+        chunk_idx = self.chunk_count
+        future.add_done_callback(lambda f: self._predictions_saved(chunk_idx, f))
         
         # 如果不是第一个chunk，需要对齐
         if self.chunk_count > 0:
             s, R, t = self.align_with_previous_chunk(self.previous_chunk_data, predictions)
             self.sim3_list.append((s, R, t))
             
-            # 应用累积变换
-            accumulated_sim3 = accumulate_sim3_transforms(self.sim3_list)
-            s_acc, R_acc, t_acc = accumulated_sim3[-1]
+            # 应用累积变换（在上一次的累积结果上增量组合，O(1)）
+            if self.cum_sim3 is None:
+                self.cum_sim3 = (s, R, t)
+            else:
+                self.cum_sim3 = compose_sim3(self.cum_sim3, (s, R, t))
+            s_acc, R_acc, t_acc = self.cum_sim3
             
             # 生成对齐后的点云
             ply_path = self.save_aligned_pointcloud(predictions, self.chunk_count, s_acc, R_acc, t_acc)
@@ -230,26 +348,42 @@ class DA3_Streaming_Realtime:
         self.processed_frames = end_idx
         self.chunk_count += 1
         
+        # 下一个chunk从 end_idx - overlap 开始，之前的帧不再需要，腾出的槽位继续预解码
+        with self._prefetch_lock:
+            self._ring_tail = max(0, end_idx - self.overlap)
+        self.prefetch_frames(self.get_num_available_frames())
+        
         return ply_path
     
+    def get_overlap_points_buffer(self, shape):
+        """(N, H, W, 3) 的点云缓冲区，形状不变时跨chunk复用（只在一次对齐内部使用）"""
+        N, H, W = shape
+        if self._overlap_points_buf is None or self._overlap_points_buf.shape != (N, H, W, 3):
+            self._overlap_points_buf = torch.empty((N, H, W, 3), dtype=torch.float32)
+        return self._overlap_points_buf
+    
     def align_with_previous_chunk(self, prev_predictions, curr_predictions):
         """与前一个chunk对齐"""
-        # 提取重叠区域的点云
-        point_map1 = depth_to_point_cloud_vectorized(
-            prev_predictions.depth, prev_predictions.intrinsics, prev_predictions.extrinsics
-        )
-        point_map2 = depth_to_point_cloud_vectorized(
-            curr_predictions.depth, curr_predictions.intrinsics, curr_predictions.extrinsics
-        )
-        
         # 计算实际的重叠区域大小（处理部分chunk的情况）
         curr_chunk_size = len(curr_predictions.depth)
         actual_overlap = min(self.overlap, curr_chunk_size)
         
-        point_map1 = point_map1[-actual_overlap:]
-        point_map2 = point_map2[:actual_overlap]
+        # 只对重叠区域的帧生成点云
+        depth1 = prev_predictions.depth[-actual_overlap:]
+        depth2 = curr_predictions.depth[:actual_overlap]
         conf1 = prev_predictions.conf[-actual_overlap:]
         conf2 = curr_predictions.conf[:actual_overlap]
+        if self.prev_overlap_points is not None and len(self.prev_overlap_points) >= actual_overlap:
+            # 上一个chunk保存点云时已经算过这些帧，直接复用
+            point_map1 = self.prev_overlap_points[-actual_overlap:]
+        else:
+            point_map1 = depth_to_point_cloud_vectorized(
+                depth1, prev_predictions.intrinsics[-actual_overlap:], prev_predictions.extrinsics[-actual_overlap:]
+            )
+        point_map2 = depth_to_point_cloud_vectorized(
+            depth2, curr_predictions.intrinsics[:actual_overlap], curr_predictions.extrinsics[:actual_overlap],
+            out=self.get_overlap_points_buffer(depth2.shape)
+        )
         
         if actual_overlap < self.overlap:
             print(f"Warning: Using reduced overlap of {actual_overlap} frames (normal: {self.overlap})")
@@ -258,10 +392,10 @@ class DA3_Streaming_Realtime:
         
         scale_factor = None
         if self.config["Model"]["align_method"] == "scale+se3":
-            chunk1_depth = np.squeeze(prev_predictions.depth[-actual_overlap:])
-            chunk2_depth = np.squeeze(curr_predictions.depth[:actual_overlap])
-            chunk1_depth_conf = np.squeeze(prev_predictions.conf[-actual_overlap:])
-            chunk2_depth_conf = np.squeeze(curr_predictions.conf[:actual_overlap])
+            chunk1_depth = np.squeeze(depth1)
+            chunk2_depth = np.squeeze(depth2)
+            chunk1_depth_conf = np.squeeze(conf1)
+            chunk2_depth_conf = np.squeeze(conf2)
             
             scale_factor_return, quality_score, method_used = precompute_scale_chunks_with_depth(
                 chunk1_depth,
@@ -288,54 +422,91 @@ class DA3_Streaming_Realtime:
     
     def save_aligned_pointcloud(self, predictions, chunk_idx, s, R, t):
         """保存对齐后的点云"""
-        # 生成世界坐标系点云
+        # 生成世界坐标系点云，累积sim3在反投影时一并施加
+        depth = predictions.depth
+        n_head = len(depth) - self.overlap  # 末尾overlap帧之前的帧数
         if chunk_idx == 0:
             world_points = depth_to_point_cloud_vectorized(
-                predictions.depth, predictions.intrinsics, predictions.extrinsics
+                depth, predictions.intrinsics, predictions.extrinsics
             )
+            # 缓存末尾overlap帧的点云（sim3之前），供下一个chunk对齐时使用
+            self.prev_overlap_points = world_points[n_head:].copy()
         else:
-            world_points = depth_to_point_cloud_optimized_torch(
-                predictions.depth, predictions.intrinsics, predictions.extrinsics
+            # 末尾overlap帧只反投影一次（不做变换）并缓存，其余帧走融合了sim3的反投影
+            self.prev_overlap_points = depth_to_point_cloud_vectorized(
+                depth[n_head:], predictions.intrinsics[n_head:], predictions.extrinsics[n_head:]
             )
-            world_points = apply_sim3_direct_torch(world_points, s, R, t)
+            world_points = np.empty(depth.shape + (3,), dtype=np.float32)
+            if n_head > 0:
+                depth_to_world_sim3(
+                    depth[:n_head], predictions.intrinsics[:n_head], predictions.extrinsics[:n_head],
+                    s, R, t, out=torch.from_numpy(world_points[:n_head]),
+                )
+            # 缓存的末尾几帧再施加sim3 (X' = s * X @ R^T + t)，直接写入结果
+            tail_points = world_points[n_head:]
+            np.matmul(self.prev_overlap_points, (s * np.asarray(R).T).astype(np.float32), out=tail_points)
+            tail_points += np.asarray(t, dtype=np.float32)
         
-        # 确定保存范围
+        # 确定保存范围（连续的帧区间，切片不产生拷贝）
         chunk_start, chunk_end = self.chunk_indices[chunk_idx]
         if chunk_idx == 0:
-            save_indices = list(range(0, chunk_end - chunk_start - self.overlap_e))
+            save_range = slice(0, chunk_end - chunk_start - self.overlap_e)
         elif chunk_idx == len(self.chunk_indices) - 1:
-            save_indices = list(range(self.overlap_s, chunk_end - chunk_start))
+            save_range = slice(self.overlap_s, chunk_end - chunk_start)
         else:
-            save_indices = list(range(self.overlap_s, chunk_end - chunk_start - self.overlap_e))
+            save_range = slice(self.overlap_s, chunk_end - chunk_start - self.overlap_e)
         
-        # 提取要保存的点和颜色
-        points = world_points[save_indices].reshape(-1, 3)
-        colors = predictions.processed_images[save_indices].reshape(-1, 3).astype(np.uint8)
-        confs = predictions.conf[save_indices].reshape(-1)
-        
-        # 保存PLY
-        ply_path = os.path.join(self.pcd_dir, f"{chunk_idx}_pcd.ply")
+        # 按置信度筛选、采样后只拷贝保留下来的点和颜色
+        confs = predictions.conf[save_range].reshape(-1)
         conf_threshold = np.mean(confs) * self.config["Model"]["Pointcloud_Save"]["conf_threshold_coef"]
         sample_ratio = self.config["Model"]["Pointcloud_Save"]["sample_ratio"]
-        
-        save_confident_pointcloud_batch(
-            points=points,
-            colors=colors,
-            confs=confs,
-            output_path=ply_path,
-            conf_threshold=conf_threshold,
-            sample_ratio=sample_ratio,
+        points, colors = select_confident_points(
+            world_points[save_range].reshape(-1, 3),
+            predictions.processed_images[save_range].reshape(-1, 3),
+            confs,
+            conf_threshold,
+            sample_ratio,
         )
         
-        print(f"Saved pointcloud to {ply_path}")
+        # 异步写入PLY，完成后通过 on_pointcloud_saved 回调通知
+        ply_path = os.path.join(self.pcd_dir, f"{chunk_idx}_pcd.ply")
+        future = self.ply_writer.submit(points, colors, ply_path)
+        future.add_done_callback(lambda f: self._pointcloud_saved(chunk_idx, f))
+        
         return ply_path
     
+    def _predictions_saved(self, chunk_idx, future):
+        error = future.exception()
+        if error is not None:
+            print(f"Error saving predictions of chunk {chunk_idx}: {error}")
+    
+    def _pointcloud_saved(self, chunk_idx, future):
+        try:
+            ply_path = future.result()
+        except Exception as e:
+            print(f"Error saving pointcloud of chunk {chunk_idx}: {e}")
+            return
+        
+        print(f"Saved pointcloud to {ply_path}")
+        if self.on_pointcloud_saved is not None:
+            self.on_pointcloud_saved(chunk_idx, ply_path)
+    
+    def close(self):
+        """等待所有后台写入完成并释放线程池/写入进程"""
+        self.io_pool.shutdown(wait=True)
+        self.ply_writer.close()
+        self.decode_pool.shutdown(wait=True)
+    
     def finalize_with_loop_closure(self):
         """完成处理并执行回环优化"""
         print("=" * 60)
         print("Finalizing with loop closure...")
         print("=" * 60)
         
+        # 等待后台的中间结果和点云写入完成
+        self.io_pool.shutdown(wait=True)
+        self.ply_writer.close()
+        
         if not self.config["Model"]["loop_enable"]:
             print("Loop closure disabled, skipping...")
             self.merge_all_pointclouds()
@@ -345,6 +516,8 @@ class DA3_Streaming_Realtime:
             # 执行回环检测
             print("\n[1/3] Starting loop detection...")
             loop_info_save_path = os.path.join(self.output_dir, "loop_closures.txt")
+            # 回环检测按图片目录读取，先把帧存储导出为单独的JPEG文件
+            self.frame_store.export_jpegs(self.frame_dir)
             loop_detector = LoopDetector(
                 image_dir=self.frame_dir,
                 output=loop_info_save_path,
@@ -0,0 +1,200 @@
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import os
+import threading
+
+import numpy as np
+
+
+class FrameStore:
+    """
+    Append-only storage for encoded (JPEG) frames.
+
+    All frames are written back to back into a single shard file
+    (`frames.bin`) and located through an in-memory (offset, length) index,
+    persisted as `index.npy` on close. One thread appends while others read
+    concurrently through a read-only mmap of the shard.
+
+    The map is not refreshed on every append: frames past its end are read
+    with `os.pread`, and the shard is remapped only once the unmapped tail
+    is as large as the mapped part, so remaps grow geometrically.
+    """
+
+    SHARD_NAME = "frames.bin"
+    INDEX_NAME = "index.npy"
+    # Unmapped data below this size is always served with pread
+    REMAP_MIN_BYTES = 16 << 20
+
+    def __init__(self, frame_dir, mode="w"):
+        """
+        Args:
+            frame_dir: directory holding the shard and its index
+            mode: "w" to start a new shard, "r" to open a closed one
+        """
+        self.frame_dir = frame_dir
+        self.shard_path = os.path.join(frame_dir, self.SHARD_NAME)
+        self.index_path = os.path.join(frame_dir, self.INDEX_NAME)
+
+        self._lock = threading.Lock()
+        self._reader = None
+        self._mm = None
+
+        if mode == "w":
+            self._writer = open(self.shard_path, "wb")
+            self._index = []
+            self._offset = 0
+        elif mode == "r":
+            self._writer = None
+            self._index = [tuple(entry) for entry in np.load(self.index_path).tolist()]
+            self._offset = sum(length for _, length in self._index)
+        else:
+            raise ValueError(f"Unsupported mode: {mode}")
+
+    def __len__(self):
+        return len(self._index)
+
+    def append(self, jpeg):
+        """
+        Append one encoded frame.
+
+        The data is flushed before the frame is added to the index, so a
+        frame is readable as soon as it is counted.
+
+        Args:
+            jpeg: bytes-like, encoded frame
+
+        Returns:
+            int, index of the frame
+        """
+        length = self._writer.write(jpeg)
+        self._writer.flush()
+        with self._lock:
+            self._index.append((self._offset, length))
+            self._offset += length
+            return len(self._index) - 1
+
+    def get(self, idx):
+        """
+        Args:
+            idx: frame index
+
+        Returns:
+            memoryview over the frame's bytes; a view into the shard mmap
+            (no copy), or a pread copy for frames past the mapped end
+        """
+        with self._lock:
+            offset, length = self._index[idx]
+            end = offset + length
+            if self._reader is None:
+                self._reader = open(self.shard_path, "rb")
+            mm = self._mm
+            if mm is None or len(mm) < end:
+                mapped = 0 if mm is None else len(mm)
+                if self._writer is None or self._offset - mapped >= max(mapped, self.REMAP_MIN_BYTES):
+                    self._remap()
+                    mm = self._mm
+                else:
+                    mm = None
+            fd = self._reader.fileno()
+        if mm is None:
+            return memoryview(os.pread(fd, length, offset))
+        return memoryview(mm)[offset:end]
+
+    def _remap(self):
+        # Map the whole shard as it is now. Older maps are left to the
+        # garbage collector since views into them may still be alive.
+        self._mm = mmap.mmap(self._reader.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def export_jpegs(self, out_dir=None):
+        """
+        Write every frame to its own `frame_XXXXXX.jpg` file, for consumers
+        that expect an image directory (e.g. LoopDetector).
+
+        Args:
+            out_dir: target directory, defaults to the store's directory
+
+        Returns:
+            str, the directory the images were written to
+        """
+        out_dir = out_dir or self.frame_dir
+        os.makedirs(out_dir, exist_ok=True)
+        for idx in range(len(self)):
+            with open(os.path.join(out_dir, f"frame_{idx:06d}.jpg"), "wb") as f:
+                f.write(self.get(idx))
+        return out_dir
+
+    def close(self):
+        """Close the shard; in write mode the index is persisted to `index.npy`."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            index = np.asarray(self._index, dtype=np.int64).reshape(-1, 2)
+            np.save(self.index_path, index)
+
+
+class FrameRing:
+    """
+    Fixed-capacity ring of decoded frames, indexed by frame number.
+
+    Slots are preallocated as one array from the first frame's shape; frame
+    `idx` lives in slot `idx % capacity` until frame `idx + capacity`
+    overwrites it. Any window of at most `capacity` consecutive frames maps
+    to distinct slots, so they can be filled concurrently.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._slots = None
+        self._ids = [-1] * capacity
+        self._lock = threading.Lock()
+
+    def get(self, idx):
+        """
+        Args:
+            idx: frame index
+
+        Returns:
+            np.ndarray view of the cached frame, or None if it is not cached
+        """
+        slot = idx % self.capacity
+        if self._slots is not None and self._ids[slot] == idx:
+            return self._slots[slot]
+        return None
+
+    def put(self, idx, img):
+        """
+        Copy a decoded frame into its slot.
+
+        Args:
+            idx: frame index
+            img: np.ndarray, decoded frame
+
+        Returns:
+            np.ndarray, the slot view holding the frame (or `img` itself if
+            its shape does not match the ring)
+        """
+        if self._slots is None:
+            with self._lock:
+                if self._slots is None:
+                    self._slots = np.empty((self.capacity,) + img.shape, dtype=img.dtype)
+        if img.shape != self._slots.shape[1:] or img.dtype != self._slots.dtype:
+            return img
+
+        slot = idx % self.capacity
+        self._ids[slot] = -1
+        np.copyto(self._slots[slot], img)
+        self._ids[slot] = idx
+        return self._slots[slot]
@@ -0,0 +1,130 @@
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cv2
+import numpy as np
+
+# libjpeg-turbo (SIMD IDCT / color conversion) when available, OpenCV otherwise
+try:
+    from turbojpeg import TJPF_BGR, TJPF_RGB, TJSAMP_420, TJSAMP_422, TJSAMP_444, TurboJPEG
+
+    _tj = TurboJPEG()
+    TURBOJPEG_AVAILABLE = True
+    _TJ_SUBSAMPLING = {"420": TJSAMP_420, "422": TJSAMP_422, "444": TJSAMP_444}
+except (ImportError, OSError, RuntimeError):
+    _tj = None
+    TURBOJPEG_AVAILABLE = False
+
+
+def decode_jpeg(buf, rgb=False):
+    """
+    Decode a JPEG image.
+
+    Args:
+        buf: bytes-like, encoded JPEG
+        rgb: bool, return RGB instead of BGR channel order
+
+    Returns:
+        np.ndarray, (H, W, 3) uint8 BGR (or RGB) image
+
+    Raises:
+        ValueError: if the data cannot be decoded
+    """
+    if _tj is not None:
+        try:
+            return _tj.decode(buf, pixel_format=TJPF_RGB if rgb else TJPF_BGR)
+        except OSError as e:
+            raise ValueError(f"Failed to decode JPEG: {e}") from e
+
+    img = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Failed to decode JPEG")
+    if rgb:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return img
+
+
+# OpenCV's equivalents (IMWRITE_JPEG_SAMPLING_FACTOR needs OpenCV >= 4.5.5)
+_CV_SUBSAMPLING = {
+    "420": "IMWRITE_JPEG_SAMPLING_FACTOR_420",
+    "422": "IMWRITE_JPEG_SAMPLING_FACTOR_422",
+    "444": "IMWRITE_JPEG_SAMPLING_FACTOR_444",
+}
+
+
+def encode_jpeg(img, quality=85, subsample="420"):
+    """
+    Encode a BGR image as JPEG.
+
+    Args:
+        img: np.ndarray, (H, W, 3) uint8 BGR image
+        quality: int, JPEG quality (0-100)
+        subsample: str, chroma subsampling, one of "420", "422", "444"
+
+    Returns:
+        bytes-like encoded JPEG (bytes with libjpeg-turbo, 1-D uint8 array otherwise)
+
+    Raises:
+        ValueError: if the image cannot be encoded
+    """
+    if subsample not in _CV_SUBSAMPLING:
+        raise ValueError(f"Unsupported chroma subsampling: {subsample}")
+
+    if _tj is not None:
+        return _tj.encode(img, quality=quality, pixel_format=TJPF_BGR,
+                          jpeg_subsample=_TJ_SUBSAMPLING[subsample])
+
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    if hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+        params += [int(cv2.IMWRITE_JPEG_SAMPLING_FACTOR), int(getattr(cv2, _CV_SUBSAMPLING[subsample]))]
+    ret, buf = cv2.imencode(".jpg", img, params)
+    if not ret:
+        raise ValueError("Failed to encode JPEG")
+    return buf
+
+
+def decode_jpeg_thumbnail(buf, size):
+    """
+    Decode a JPEG directly at reduced resolution and resize it to `size`.
+
+    With libjpeg-turbo the largest DCT-domain scaling (1/2, 1/4, 1/8) that
+    still covers `size` is used, so the full-resolution IDCT is skipped.
+
+    Args:
+        buf: bytes-like, encoded JPEG
+        size: (width, height) of the output image
+
+    Returns:
+        np.ndarray, (height, width, 3) uint8 BGR image
+
+    Raises:
+        ValueError: if the data cannot be decoded
+    """
+    if _tj is None:
+        return cv2.resize(decode_jpeg(buf), size)
+
+    try:
+        width, height, _, _ = _tj.decode_header(buf)
+        denom = 1
+        for d in (8, 4, 2):
+            if width // d >= size[0] and height // d >= size[1]:
+                denom = d
+                break
+        img = _tj.decode(buf, pixel_format=TJPF_BGR, scaling_factor=(1, denom))
+    except OSError as e:
+        raise ValueError(f"Failed to decode JPEG: {e}") from e
+
+    if (img.shape[1], img.shape[0]) != tuple(size):
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return img
@@ -0,0 +1,183 @@
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module is preloaded into the writer's forkserver, so it must only
+# import the standard library and numpy.
+import multiprocessing as mp
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Vertex record layout matching the header written by write_ply_header
+PLY_VERTEX_DTYPE = np.dtype(
+    [
+        ("x", "<f4"),
+        ("y", "<f4"),
+        ("z", "<f4"),
+        ("red", "u1"),
+        ("green", "u1"),
+        ("blue", "u1"),
+    ]
+)
+
+# Size of one packed PLY vertex record: xyz float32 | rgb uint8
+BYTES_PER_POINT = PLY_VERTEX_DTYPE.itemsize
+
+
+def write_ply_header(f, num_vertices):
+    header = [
+        "ply",
+        "format binary_little_endian 1.0",
+        f"element vertex {num_vertices}",
+        "property float x",
+        "property float y",
+        "property float z",
+        "property uchar red",
+        "property uchar green",
+        "property uchar blue",
+        "end_header",
+    ]
+    f.write("\n".join(header).encode() + b"\n")
+
+
+def _vertex_records(buf, num_points):
+    return np.ndarray((num_points,), dtype=PLY_VERTEX_DTYPE, buffer=buf)
+
+
+def _save_ply_from_shm(shm_name, num_points, output_path):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # The block already holds packed PLY vertex records, so the body is
+        # written in a single call without any conversion
+        records = _vertex_records(shm.buf, num_points)
+        # Write under a temporary name so readers never see a partial file
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            write_ply_header(f, num_points)
+            records.tofile(f)
+        os.replace(tmp_path, output_path)
+        del records
+    finally:
+        shm.close()
+    return output_path
+
+
+def _noop():
+    return None
+
+
+def _mp_context():
+    # Workers fork from a small server that has only this module loaded,
+    # instead of starting a fresh interpreter per worker
+    if "forkserver" not in mp.get_all_start_methods():
+        return mp.get_context("spawn")
+    ctx = mp.get_context("forkserver")
+    ctx.set_forkserver_preload(["loop_utils.ply_writer"])
+    return ctx
+
+
+@contextmanager
+def _hide_main_module():
+    """
+    Keep new worker processes from re-importing the parent's __main__.
+
+    Both spawn and forkserver children run the main script again (as
+    __mp_main__) before unpickling their task. For the realtime service that
+    drags in Flask, torch and the DA3 model code, none of which the writer
+    needs, since its task lives in this module.
+    """
+    main = sys.modules.get("__main__")
+    if main is None:
+        yield
+        return
+    saved = {name: main.__dict__[name] for name in ("__file__", "__spec__") if name in main.__dict__}
+    main.__spec__ = None
+    main.__dict__.pop("__file__", None)
+    try:
+        yield
+    finally:
+        main.__dict__.pop("__spec__", None)
+        main.__dict__.update(saved)
+
+
+class PointCloudWriter:
+    """
+    Writes point clouds to binary PLY in a separate process.
+
+    The points are packed once into a shared-memory block laid out as PLY
+    vertex records, and the worker process writes that block to disk, so
+    PLY encoding does not hold the GIL of the caller. Blocks are recycled
+    once their write completes, so steady-state chunks of similar size do
+    not allocate new shared memory.
+    """
+
+    def __init__(self):
+        self._pool = ProcessPoolExecutor(max_workers=1, mp_context=_mp_context())
+        # Start the worker now rather than on the first chunk; the pool only
+        # launches its process here, so __main__ is hidden just for this call
+        with _hide_main_module():
+            self._pool.submit(_noop)
+        self._free_blocks = []
+        self._lock = threading.Lock()
+
+    def _acquire_block(self, size):
+        with self._lock:
+            for i, shm in enumerate(self._free_blocks):
+                if shm.size >= size:
+                    return self._free_blocks.pop(i)
+        # Leave headroom so slightly larger chunks can reuse the block
+        return shared_memory.SharedMemory(create=True, size=max(1, size + size // 4))
+
+    def _release_block(self, shm):
+        with self._lock:
+            self._free_blocks.append(shm)
+
+    def submit(self, points, colors, output_path):
+        """
+        Queue one point cloud for writing.
+
+        Args:
+            points: np.ndarray, (N, 3)
+            colors: np.ndarray, (N, 3) uint8
+            output_path: str, PLY path; the file appears atomically once complete
+
+        Returns:
+            concurrent.futures.Future resolving to output_path
+        """
+        num_points = len(points)
+        shm = self._acquire_block(num_points * BYTES_PER_POINT)
+        records = _vertex_records(shm.buf, num_points)
+        for i, name in enumerate(("x", "y", "z")):
+            records[name] = points[:, i]
+        for i, name in enumerate(("red", "green", "blue")):
+            records[name] = colors[:, i]
+        del records
+
+        future = self._pool.submit(_save_ply_from_shm, shm.name, num_points, output_path)
+        future.add_done_callback(lambda _: self._release_block(shm))
+        return future
+
+    def close(self):
+        """Wait for all queued writes, stop the worker process and free the blocks."""
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            for shm in self._free_blocks:
+                shm.close()
+                shm.unlink()
+            self._free_blocks = []
@@ -17,10 +17,12 @@
 import bisect
 import glob
 import os
+import shutil
 import numpy as np
 import trimesh
 from loop_utils.alignment_torch import robust_weighted_estimate_sim3_torch
 from loop_utils.alignment_triton import robust_weighted_estimate_sim3_triton
+from loop_utils.ply_writer import PLY_VERTEX_DTYPE, write_ply_header
 from numba import njit
 from sklearn.linear_model import LinearRegression, RANSACRegressor
 
@@ -46,16 +48,32 @@ def accumulate_sim3_transforms(transforms):
     cumulative_transforms = [transforms[0]]
 
     for i in range(1, len(transforms)):
-        s_cum_prev, R_cum_prev, t_cum_prev = cumulative_transforms[i - 1]
-        s_next, R_next, t_next = transforms[i]
-        R_cum_new = R_cum_prev @ R_next
-        s_cum_new = s_cum_prev * s_next
-        t_cum_new = s_cum_prev * (R_cum_prev @ t_next) + t_cum_prev
-        cumulative_transforms.append((s_cum_new, R_cum_new, t_cum_new))
+        cumulative_transforms.append(compose_sim3(cumulative_transforms[i - 1], transforms[i]))
 
     return cumulative_transforms
 
 
+def compose_sim3(cumulative, transform):
+    """
+    Append one adjacent SIM(3) transform to a cumulative one, i.e. a single
+    step of accumulate_sim3_transforms. Lets streaming callers keep the
+    running transform in O(1) per chunk instead of re-accumulating the chain.
+
+    Args:
+    cumulative: (s_cum, R_cum, t_cum), transform from frame 0 to frame k-1
+    transform: (s, R, t), transform from frame k-1 to frame k
+
+    Returns:
+    (s_cum, R_cum, t_cum) from frame 0 to frame k
+    """
+    s_cum_prev, R_cum_prev, t_cum_prev = cumulative
+    s_next, R_next, t_next = transform
+    R_cum_new = R_cum_prev @ R_next
+    s_cum_new = s_cum_prev * s_next
+    t_cum_new = s_cum_prev * (R_cum_prev @ t_next) + t_cum_prev
+    return (s_cum_new, R_cum_new, t_cum_new)
+
+
 def estimate_sim3(source_points, target_points):
     mu_src = np.mean(source_points, axis=0)
     mu_tgt = np.mean(target_points, axis=0)
@@ -322,6 +340,31 @@ def save_confident_pointcloud_batch(
         save_ply(reservoir_pts, reservoir_clr, output_path)
 
 
+def select_confident_points(points, colors, confs, conf_threshold, sample_ratio=1.0):
+    """
+    Keep the points save_confident_pointcloud_batch would write, gathering
+    only the surviving points instead of filtering full-size copies.
+
+    - points: np.ndarray, (N, 3)
+    - colors: np.ndarray, (N, 3)
+    - confs: np.ndarray, (N,)
+    - conf_threshold: float
+    - sample_ratio: float (0 < sample_ratio <= 1.0), uniform subsampling
+      without replacement of the confident points
+
+    Returns:
+    (points float32 (M, 3), colors uint8 (M, 3))
+    """
+    idx = np.flatnonzero((confs >= conf_threshold) & (confs > 1e-5))
+    if sample_ratio < 1.0:
+        num_samples = int(len(idx) * sample_ratio)
+        idx = np.sort(np.random.choice(idx, num_samples, replace=False))
+
+    points = points.take(idx, axis=0).astype(np.float32, copy=False)
+    colors = colors.take(idx, axis=0).astype(np.uint8, copy=False)
+    return points, colors
+
+
 """ The following function is deprecated"""
 
 # def vectorized_reservoir_sampling(new_pts, new_cls, current_count, reservoir_pts, reservoir_clr):
@@ -412,34 +455,8 @@ def optimized_vectorized_reservoir_sampling(
     return current_count + num_new_points, reservoir_points, reservoir_colors
 
 
-def write_ply_header(f, num_vertices):
-    header = [
-        "ply",
-        "format binary_little_endian 1.0",
-        f"element vertex {num_vertices}",
-        "property float x",
-        "property float y",
-        "property float z",
-        "property uchar red",
-        "property uchar green",
-        "property uchar blue",
-        "end_header",
-    ]
-    f.write("\n".join(header).encode() + b"\n")
-
-
 def write_ply_batch(f, points, colors):
-    structured = np.zeros(
-        len(points),
-        dtype=[
-            ("x", np.float32),
-            ("y", np.float32),
-            ("z", np.float32),
-            ("red", np.uint8),
-            ("green", np.uint8),
-            ("blue", np.uint8),
-        ],
-    )
+    structured = np.empty(len(points), dtype=PLY_VERTEX_DTYPE)
 
     structured["x"] = points[:, 0]
     structured["y"] = points[:, 1]
@@ -448,7 +465,8 @@ def write_ply_batch(f, points, colors):
     structured["green"] = colors[:, 1]
     structured["blue"] = colors[:, 2]
 
-    f.write(structured.tobytes())
+    # Write the packed records straight from the array, without a bytes copy
+    structured.tofile(f)
 
 
 def save_ply(points, colors, filename):
@@ -543,10 +561,30 @@ def compute_sim3_ab(S_a, S_b):
     return (s_ab, R_ab, T_ab)
 
 
+def read_ply_header(f):
+    """
+    Parse the header of a PLY file opened in binary mode.
+
+    Returns:
+    (num_vertices, body_offset), body_offset being the byte offset of the
+    vertex data right after "end_header"
+    """
+    num_vertices = 0
+    for line in f:
+        if line.startswith(b"element vertex"):
+            num_vertices = int(line.split()[-1])
+        elif line.startswith(b"end_header"):
+            break
+    return num_vertices, f.tell()
+
+
 def merge_ply_files(input_dir, output_path):
     """
     Merge all PLY files in a directory into one file (without loading into memory)
 
+    All inputs share the binary vertex layout written by write_ply_header, so
+    the merged file is a new header followed by each input's vertex bytes.
+
     Args:
     - input_dir: Input directory containing multiple '{idx}_pcd.ply' files
     - output_path: Output file path (e.g., 'combined.ply')
@@ -554,50 +592,34 @@ def merge_ply_files(input_dir, output_path):
 
     print("Merging PLY files...")
 
-    input_files = sorted(glob.glob(os.path.join(input_dir, "*_pcd.ply")))
+    output_abspath = os.path.abspath(output_path)
+    input_files = [
+        file
+        for file in sorted(glob.glob(os.path.join(input_dir, "*_pcd.ply")))
+        if os.path.abspath(file) != output_abspath
+    ]
 
     if not input_files:
         print("No PLY files found")
         return
 
-    idx_file = 0
-    len(input_files)
-
+    # Parse every header once: vertex count and where the vertex data starts
+    bodies = []
     total_vertices = 0
-    for file in input_files:  # Count total vertices
+    for file in input_files:
         with open(file, "rb") as f:
-            for line in f:
-                if line.startswith(b"element vertex"):
-                    vertex_count = int(line.split()[-1])
-                    total_vertices += vertex_count
-                elif line.startswith(b"end_header"):
-                    break
+            num_vertices, body_offset = read_ply_header(f)
+        bodies.append((file, body_offset))
+        total_vertices += num_vertices
 
     with open(output_path, "wb") as out_f:
-        # Write new header
-        out_f.write(b"ply\n")
-        out_f.write(b"format binary_little_endian 1.0\n")
-        out_f.write(f"element vertex {total_vertices}\n".encode())
-        out_f.write(b"property float x\n")
-        out_f.write(b"property float y\n")
-        out_f.write(b"property float z\n")
-        out_f.write(b"property uchar red\n")
-        out_f.write(b"property uchar green\n")
-        out_f.write(b"property uchar blue\n")
-        out_f.write(b"end_header\n")
-
-        for file in input_files:
-            print(f"Processing {idx_file}/{len(input_files)}: {file}")
-            idx_file += 1
+        write_ply_header(out_f, total_vertices)
+
+        for idx_file, (file, body_offset) in enumerate(bodies):
+            print(f"Processing {idx_file}/{len(bodies)}: {file}")
             with open(file, "rb") as in_f:
-                # Skip the head
-                in_header = True
-                while in_header:
-                    line = in_f.readline()
-                    if line.startswith(b"end_header"):
-                        in_header = False
-                data = in_f.read()
-                out_f.write(data)
+                in_f.seek(body_offset)
+                shutil.copyfileobj(in_f, out_f, length=1 << 20)
 
     print(f"Merge completed! Total points: {total_vertices}")
     print(f"Output file: {output_path}")
@@ -0,0 +1,76 @@
+# Copyright (c) 2025 ByteDance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    import json
+
+    def json_loads(buf):
+        return json.loads(bytes(buf))
+
+# Wire format of a frame message: [header, jpeg]
+#   header: little-endian float64 capture timestamp (time.time())
+#   jpeg:   raw JPEG bytes
+FRAME_HEADER = struct.Struct("<d")
+
+
+def pack_frame_message(timestamp, jpeg):
+    """
+    Build the multipart message for one frame.
+
+    Args:
+        timestamp: float, capture timestamp in seconds
+        jpeg: bytes-like, encoded JPEG image
+
+    Returns:
+        list of message parts for `socket.send_multipart`
+    """
+    return [FRAME_HEADER.pack(timestamp), jpeg]
+
+
+def unpack_frame_message(parts):
+    """
+    Parse a frame message received with `socket.recv_multipart`.
+
+    Single-part messages are treated as the legacy JSON envelope
+    {"timestamp": float, "image": base64 JPEG} sent by older publishers.
+
+    Args:
+        parts: list of message parts, either bytes or zmq.Frame objects
+            (`recv_multipart(copy=False)`); frames are read through their
+            buffer without copying
+
+    Returns:
+        (timestamp, jpeg) where timestamp may be None for legacy messages
+        without one, and jpeg is a bytes-like object. For multipart messages
+        jpeg is the memoryview of the received part itself; it can be handed
+        to `decode_jpeg`/`np.frombuffer`/`file.write` without a `bytes` copy
+    """
+    parts = [getattr(part, "buffer", part) for part in parts]
+
+    if len(parts) == 1:
+        data = json_loads(parts[0])
+        jpeg = base64.b64decode(data["image"], validate=False)
+        return data.get("timestamp"), jpeg
+
+    timestamp = FRAME_HEADER.unpack(parts[0])[0]
+    return timestamp, parts[1]
@@ -3,20 +3,28 @@
     ZeroMQ Publisher for Webcam Frames with Pygame Visualization
 
     Uses OpenCV to read frames and publish them via ZeroMQ PUB socket.
-    Employs multithreading and a deque to ensure the latest frames are published
+    Employs multithreading and a single latest-frame slot to ensure the latest frames are published
     at a controlled FPS. Pygame is used for robust, thread-safe GUI visualization.
     pip install pyzmq pygame
 """
 import cv2
+import os
 import threading
 import argparse
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import time
 import numpy as np
 import zmq
 import base64
 import pygame # Import Pygame
-import json # Import json for packaging data
+try:
+    import orjson # C JSON encoder for the legacy envelope
+except ImportError:
+    orjson = None
+
+from loop_utils.jpeg_utils import decode_jpeg, encode_jpeg
+from loop_utils.zmq_utils import pack_frame_message
 
 # --- Command Line Argument Parser ---
 parser = argparse.ArgumentParser(description="ZeroMQ Webcam Publisher with Pygame GUI")
@@ -32,21 +40,71 @@ parser.add_argument('--show_video', action='store_true',
                     help='Display the published video stream locally using Pygame.')
 parser.add_argument('--jpeg_quality', type=int, default=85,
                     help='JPEG compression quality (0-100). Lower is smaller size, higher is better quality.')
+parser.add_argument('--subsample', type=str, default='420', choices=['420', '422', '444'],
+                    help='JPEG chroma subsampling. 4:2:0 is the fastest to encode and the smallest on the wire.')
 parser.add_argument('--port', type=int, default=5555,
                     help='ZeroMQ port to bind to.')
+parser.add_argument('--frame_stride', type=int, default=1,
+                    help='Decode and publish only every N-th camera frame; skipped frames are grab()bed but never decoded.')
+parser.add_argument('--sndhwm', type=int, default=4,
+                    help='ZeroMQ send high-water mark (frames queued per subscriber before dropping).')
+parser.add_argument('--encode_workers', type=int, default=1,
+                    help='Frames JPEG-encoded in parallel. 1 encodes each frame before sending it; '
+                         'more overlaps encoding with the next frame when a single encode exceeds 1/fps.')
+parser.add_argument('--pin_cpus', type=str, default=None,
+                    help='Comma-separated CPUs for the camera read and publish threads (e.g. "0,1"). '
+                         'The read thread also gets a higher priority when permitted (Linux only).')
+parser.add_argument('--mjpeg_passthrough', action='store_true',
+                    help='Forward the camera\'s MJPEG frames as-is instead of decoding and re-encoding them '
+                         '(--jpeg_quality is then ignored).')
+parser.add_argument('--legacy_json', action='store_true',
+                    help='Publish the old single-part JSON+base64 message instead of [timestamp, jpeg] multipart.')
+
+
+def pin_current_thread(cpu, nice=None):
+    """
+    Pins the calling thread to one CPU and optionally changes its nice value.
+    Linux only; failures (unsupported platform, missing privileges) are reported and ignored.
+    """
+    try:
+        os.sched_setaffinity(0, {cpu}) # 0 = the calling thread
+    except (AttributeError, OSError) as e:
+        print(f"Warning: Could not pin thread to CPU {cpu}: {e}")
+        return
+    if nice is not None:
+        try:
+            # Raising priority (negative nice) needs CAP_SYS_NICE or root
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        except (AttributeError, OSError) as e:
+            print(f"Warning: Could not set thread nice value to {nice}: {e}")
 
 
 class WebcamStreamZMQ:
-    def __init__(self, src=0, fps=30, h=480, w=640, show_gui=False, jpeg_quality=85, port=5555):
+    def __init__(self, src=0, fps=30, h=480, w=640, show_gui=False, jpeg_quality=85, port=5555,
+                 legacy_json=False, frame_stride=1, sndhwm=4, encode_workers=1, pin_cpus=None,
+                 mjpeg_passthrough=False, subsample='420'):
 
         self.port = port
+        self.frame_stride = max(1, frame_stride)
+        self.pin_cpus = pin_cpus # (read_cpu, publish_cpu) or None
+        self.legacy_json = legacy_json
         self.jpeg_quality = jpeg_quality
+        self.subsample = subsample
+        # JPEG encoders release the GIL, so a thread pool encodes frames in parallel
+        self.encode_workers = max(1, encode_workers)
+        self._encoder_pool = ThreadPoolExecutor(max_workers=self.encode_workers)
         self.width = w
         self.height = h
 
         # --- ZeroMQ Context and Socket Setup ---
         self.zmq_context = zmq.Context()
         self.zmq_socket = self.zmq_context.socket(zmq.PUB)
+        # 发送端每个订阅者最多积压几帧，订阅者变慢时丢旧帧而不是堆积延迟
+        # （ZMQ_CONFLATE 不支持多帧消息，这里用小的SNDHWM代替）
+        self.zmq_socket.setsockopt(zmq.SNDHWM, sndhwm)
+        self.zmq_socket.setsockopt(zmq.IMMEDIATE, 1)
+        self.zmq_socket.setsockopt(zmq.LINGER, 0)
+        self.zmq_socket.setsockopt(zmq.TCP_KEEPALIVE, 1)
         try:
             self.zmq_socket.bind(f'tcp://*:{self.port}')
             print(f"ZeroMQ Publisher bound to tcp://*:{self.port}")
@@ -62,10 +120,16 @@ class WebcamStreamZMQ:
             raise IOError("Cannot open webcam")
 
         # Set camera properties
+        # 驱动只保留1个缓冲帧，读到的总是最新帧，无需先grab丢弃旧帧
+        self.stream.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
         self.stream.set(cv2.CAP_PROP_FPS, fps)
         self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
         self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # MJPEG直通：retrieve返回摄像头输出的JPEG码流（1维uint8），不在OpenCV里解码
+        self.mjpeg_passthrough = mjpeg_passthrough
+        if self.mjpeg_passthrough:
+            self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 0)
 
         # Verify actual camera settings (often different from requested)
         actual_fps = self.stream.get(cv2.CAP_PROP_FPS)
@@ -75,31 +139,32 @@ class WebcamStreamZMQ:
               f"Actual Resolution: {int(actual_width)}x{int(actual_height)}, "
               f"Actual FPS: {actual_fps:.2f}")
 
-        # --- Threading and Frame Queue Setup ---
-        # The deque will now store tuples of (frame, timestamp)
-        # 增加队列大小以避免帧跳跃，但保持较小以降低延迟
-        self.frame_queue = deque(maxlen=3)
-        self.queue_lock = threading.Lock() # Protects access to the deque
+        # --- Threading and Latest-Frame Slot Setup ---
+        # Single slot holding the newest (frame, timestamp) tuple. The read thread
+        # replaces it with one attribute store (atomic under the GIL) and the
+        # publish/GUI threads just read it, so no lock or queue is needed
+        self.latest_frame = None
 
         self.stopped = False # Flag to control thread termination
 
-        # 清空摄像头缓冲区，确保获取最新帧
-        # 先grab几次丢弃旧帧，再retrieve获取新帧
-        for _ in range(5):
-            self.stream.grab()
-        ret, frame = self.stream.retrieve()
-        
+        ret, frame = self.stream.read()
+
+        if ret and self.mjpeg_passthrough and frame.ndim == 3:
+            # 后端忽略了CONVERT_RGB（或摄像头不输出MJPEG），退回解码+编码
+            print("Warning: Camera does not deliver raw MJPEG frames, disabling --mjpeg_passthrough.")
+            self.mjpeg_passthrough = False
+            self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            ret, frame = self.stream.read()
+
         if ret:
-            with self.queue_lock:
-                # Store frame and its capture timestamp
-                #self.frame_queue.append((frame, time.perf_counter())) # perf_counter cannot be used across machine
-                self.frame_queue.append((frame, time.time()))
-            self.frame = frame.copy() # For GUI display, updated by read thread
+            # Store frame and its capture timestamp
+            #self.latest_frame = (frame, time.perf_counter()) # perf_counter cannot be used across machine
+            self.latest_frame = (frame, time.time())
         else:
             print("Warning: Failed to read initial frame from camera. GUI might be blank initially.")
-            self.frame = None
 
         self.frame_count = 0 # Counts frames successfully read from camera
+        self.grab_count = 0 # Counts frames grabbed from camera (decoded or not)
 
         # Publisher FPS control
         self.target_fps = fps
@@ -122,19 +187,23 @@ class WebcamStreamZMQ:
     def _update(self):
         """
         Continuously reads frames from the camera.
-        This thread runs at a controlled rate to ensure we get fresh frames
-        and prevent reading stale buffered frames.
+        With a single driver buffer, grab() blocks until the next frame arrives,
+        so the loop runs at the camera rate and never sees stale frames.
         """
         print("Starting camera read thread...")
-        # 根据目标FPS计算读取间隔，稍微快一点以确保有足够的新帧
-        read_interval = max(0.01, self.target_dt * 0.8)  # 比发布FPS稍快
+        if self.pin_cpus:
+            pin_current_thread(self.pin_cpus[0], nice=-5)
         
         while not self.stopped:
-            start_read = time.time()
-            
-            # 使用grab()和retrieve()分离，确保获取最新帧
-            # 先grab丢弃旧帧（如果缓冲区有多个帧）
+            # grab()和retrieve()分开，跳过的帧只grab不解码
             if self.stream.grab():
+                self.grab_count += 1
+                # 只对每 frame_stride 帧中的一帧做retrieve（解码），其余帧只grab不解码
+                if self.grab_count % self.frame_stride != 0:
+                    continue
+                # 在grab返回时记录时间戳（一帧只取一次），不把retrieve的解码时间算进去
+                #capture_time = time.perf_counter() # perf_counter cannot be used across machine
+                capture_time = time.time()
                 ret, frame = self.stream.retrieve()
             else:
                 ret = False
@@ -142,67 +211,92 @@ class WebcamStreamZMQ:
             
             if ret:
                 self.frame_count += 1
-                with self.queue_lock:
-                    # Store frame and its capture timestamp
-                    #self.frame_queue.append((frame, time.perf_counter())) # perf_counter cannot be used across machine
-                    self.frame_queue.append((frame, time.time()))
-                self.frame = frame.copy() # Update the frame used by GUI
+                # Store frame and its capture timestamp
+                self.latest_frame = (frame, capture_time)
             else:
                 print("Warning: Failed to read frame from camera. Is it still connected?")
                 time.sleep(0.1)
-            
-            # 控制读取频率，避免过快读取导致获取到缓冲的旧帧
-            elapsed = time.time() - start_read
-            sleep_time = max(0.0, read_interval - elapsed)
-            if sleep_time > 0:
-                time.sleep(sleep_time)
         print("Camera read thread stopped.")
 
     def _publish(self):
         """
-        Publishes the latest frame from the deque via ZeroMQ PUB socket at the target FPS.
-        The message now includes a timestamp for latency calculation.
+        Publishes the latest frame via ZeroMQ PUB socket at the target FPS.
+        Each camera frame is published at most once.
+        Each message is [timestamp, jpeg] multipart (or the legacy JSON envelope with --legacy_json).
+        JPEG encoding runs on the encoder pool; up to `encode_workers` frames are
+        encoded concurrently and sent in capture order.
         """
         print(f"Starting ZMQ publish thread at {self.target_fps} FPS...")
+        if self.pin_cpus:
+            pin_current_thread(self.pin_cpus[-1])
+        pending = deque() # (timestamp, future) of frames being encoded, oldest first
+        last_published = None # (frame, timestamp) tuple submitted last
+        # Absolute deadlines (monotonic clock) so per-tick overrun does not accumulate into drift
+        next_deadline = time.monotonic()
         while not self.stopped:
-            start_time = time.time()
 
-            frame_data_to_publish = None
-            with self.queue_lock:
-                if self.frame_queue:
-                    # Retrieve the tuple (frame, timestamp)
-                    frame_data_to_publish = self.frame_queue[0]
+            # Retrieve the tuple (frame, timestamp)
+            frame_data_to_publish = self.latest_frame
 
-            if frame_data_to_publish is not None:
+            # The read thread stores a new tuple per frame, so an identical tuple means
+            # no new frame arrived: skip it rather than encode and send a duplicate
+            if frame_data_to_publish is not None and frame_data_to_publish is not last_published:
+                last_published = frame_data_to_publish
                 frame_to_publish, timestamp = frame_data_to_publish
-                try:
-                    ret, buf = cv2.imencode(".jpg", frame_to_publish,
-                                            [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
-                    if ret:
-                        jpg_as_text = base64.b64encode(buf).decode('utf-8')
-
-                        # Create a dictionary to hold the image and timestamp
-                        message = {
-                            "timestamp": timestamp,
-                            "image": jpg_as_text
-                        }
-
-                        # Serialize the dictionary to a JSON string and send
-                        self.zmq_socket.send_string(json.dumps(message))
-                        del buf # 感觉有用，手动尽快删除缓存
-                    else:
-                        print("Error: Failed to encode frame to JPEG.")
-                except Exception as e:
-                    print(f"Error publishing frame: {e}")
-            else:
-                time.sleep(0.005)
-
-            elapsed = time.time() - start_time
-            sleep_time = max(0.0, self.target_dt - elapsed)
+                if self.mjpeg_passthrough:
+                    # Already a JPEG from the camera: send it without touching the pixels
+                    future = Future()
+                    future.set_result(frame_to_publish)
+                else:
+                    # libjpeg-turbo (SIMD) when available, cv2.imencode otherwise; both release the GIL
+                    future = self._encoder_pool.submit(
+                        encode_jpeg, frame_to_publish, self.jpeg_quality, self.subsample)
+                pending.append((timestamp, future))
+
+            # 按顺序发送已编码完的帧；在途编码数达到上限时等待最早的一帧
+            while pending and (pending[0][1].done() or len(pending) >= self.encode_workers):
+                timestamp, future = pending.popleft()
+                self._send_frame(timestamp, future)
+
+            next_deadline += self.target_dt
+            sleep_time = next_deadline - time.monotonic()
             if sleep_time > 0:
                 time.sleep(sleep_time)
+            else:
+                # More than a whole tick behind: restart the schedule instead of bursting to catch up
+                next_deadline = time.monotonic()
         print("ZMQ publish thread stopped.")
 
+    def _send_frame(self, timestamp, future):
+        """
+        Sends one encoded frame; `future` resolves to the JPEG bytes.
+        """
+        try:
+            buf = future.result()
+            if self.legacy_json:
+                jpg_as_text = base64.b64encode(buf)
+                if orjson is not None:
+                    # Create a dictionary to hold the image and timestamp
+                    message = {
+                        "timestamp": timestamp,
+                        "image": jpg_as_text.decode('ascii') # base64 is pure ASCII
+                    }
+
+                    # Serialize the dictionary to JSON bytes and send
+                    self.zmq_socket.send(orjson.dumps(message))
+                else:
+                    # base64 text needs no JSON escaping, so the envelope is assembled
+                    # directly instead of going through a dict and json.dumps
+                    self.zmq_socket.send(b'{"timestamp": %a, "image": "%s"}' % (timestamp, jpg_as_text))
+            else:
+                # Raw JPEG bytes as a binary frame: no base64 inflation, no JSON.
+                # copy=False lets zmq reference the JPEG buffer instead of copying it
+                self.zmq_socket.send_multipart(pack_frame_message(timestamp, buf), copy=False)
+        except ValueError as e:
+            print(f"Error: Failed to encode frame to JPEG: {e}")
+        except Exception as e:
+            print(f"Error publishing frame: {e}")
+
     def _show_frames(self):
         """
         Pygame GUI thread to display the latest frame.
@@ -218,6 +312,7 @@ class WebcamStreamZMQ:
 
             start_time_gui = time.time()
             displayed_frame_count = 0
+            last_displayed = None # (frame, timestamp) tuple drawn last
 
             while not self.stopped:
                 # Event handling for quitting the Pygame window
@@ -230,7 +325,21 @@ class WebcamStreamZMQ:
                 if self.stopped: # Check again after event loop
                     break
 
-                current_frame_for_display = self.frame
+                # retrieve() returns a new array for every frame, so the GUI can show
+                # the newest frame directly instead of keeping its own copy.
+                # Only redraw when the read thread has stored a new frame
+                item = self.latest_frame
+                if item is None or item is last_displayed:
+                    current_frame_for_display = None
+                else:
+                    current_frame_for_display = item[0]
+                    last_displayed = item
+                    if self.mjpeg_passthrough:
+                        # Frames are still compressed; decode only the ones the GUI shows
+                        try:
+                            current_frame_for_display = decode_jpeg(current_frame_for_display)
+                        except ValueError:
+                            current_frame_for_display = None
 
                 if current_frame_for_display is not None:
                     displayed_frame_count += 1
@@ -243,13 +352,16 @@ class WebcamStreamZMQ:
                         camera_read_fps = 0
                         gui_fps = 0
 
-                    # Convert OpenCV BGR image (numpy array) to Pygame Surface (RGB)
-                    # OpenCV uses BGR, Pygame expects RGB, so swap channels
-                    frame_rgb = cv2.cvtColor(current_frame_for_display, cv2.COLOR_BGR2RGB)
-                    pygame_surface = pygame.surfarray.make_surface(frame_rgb.swapaxes(0, 1)) # Transpose for Pygame
-
+                    # Wrap the OpenCV BGR image (contiguous H x W x 3 uint8) as a Pygame Surface
+                    # directly: SDL reads BGR row-major pixels itself, so no channel swap,
+                    # transpose or copy is needed
+                    frame_h, frame_w = current_frame_for_display.shape[:2]
+                    pygame_surface = pygame.image.frombuffer(
+                        current_frame_for_display, (frame_w, frame_h), 'BGR')
 
-                    self.screen.fill((0, 0, 0)) # Clear screen (optional, but good practice)
+                    # Clear only the border a smaller frame would leave uncovered
+                    if (frame_w, frame_h) != self.screen.get_size():
+                        self.screen.fill((0, 0, 0))
                     self.screen.blit(pygame_surface, (0, 0)) # Draw the image
 
                     # Render FPS text
@@ -261,7 +373,7 @@ class WebcamStreamZMQ:
 
                     pygame.display.flip() # Update the full display Surface to the screen
                 else:
-                    time.sleep(0.01) # Wait if no frame is available yet
+                    time.sleep(0.01) # Wait if no new frame is available yet
 
                 self.pygame_clock.tick(60) # Limit GUI FPS to 60 or less
         except Exception as e:
@@ -285,6 +397,7 @@ class WebcamStreamZMQ:
         if self.show_gui and self.gui_thread.is_alive():
             self.gui_thread.join() # Wait for GUI thread to finish its pygame.quit()
 
+        self._encoder_pool.shutdown(wait=True)
         self.stream.release() # Release the camera resource
         self.zmq_socket.close() # Close the ZMQ socket
         self.zmq_context.term() # Terminate the ZMQ context
@@ -297,7 +410,11 @@ if __name__ == "__main__":
     try:
         cam_stream_zmq = WebcamStreamZMQ(
             args.cam_num, fps=args.fps, h=args.h, w=args.w,
-            show_gui=args.show_video, jpeg_quality=args.jpeg_quality, port=args.port
+            show_gui=args.show_video, jpeg_quality=args.jpeg_quality, port=args.port,
+            legacy_json=args.legacy_json, frame_stride=args.frame_stride, sndhwm=args.sndhwm,
+            encode_workers=args.encode_workers,
+            pin_cpus=[int(cpu) for cpu in args.pin_cpus.split(',')] if args.pin_cpus else None,
+            mjpeg_passthrough=args.mjpeg_passthrough, subsample=args.subsample
         )
         print("ZeroMQ WebcamStreamZMQ instance created. Running...")
 
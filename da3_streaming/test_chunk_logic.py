@@ -4,6 +4,18 @@
 测试chunk处理逻辑
 """
 
+TOTAL_FRAMES = 300  # 模拟接收的总帧数
+
+
+def chunk_triggers(chunk_size, overlap, total_frames):
+    """第 i 个chunk在第 chunk_size + i * (chunk_size - overlap) 帧时触发（闭式计算，无需逐帧模拟）"""
+    step = chunk_size - overlap
+    if total_frames < chunk_size:
+        return []
+    num_chunks = (total_frames - chunk_size) // step + 1
+    return [chunk_size + i * step for i in range(num_chunks)]
+
+
 def test_chunk_logic():
     """测试chunk触发逻辑"""
     chunk_size = 120
@@ -14,44 +26,22 @@ def test_chunk_logic():
     print(f"chunk_size = {chunk_size}, overlap = {overlap}")
     print("=" * 60)
     
-    chunk_count = 0
-    processed_frames = 0
+    triggers = chunk_triggers(chunk_size, overlap, TOTAL_FRAMES)
     
-    # 模拟接收帧的过程
-    for total_frames in range(1, 301):
-        # 检查是否应该处理chunk
-        if chunk_count == 0:
-            required_frames = chunk_size
-        else:
-            required_frames = processed_frames - overlap + chunk_size
+    # 只遍历触发帧，chunk i 的范围是 [trigger - chunk_size : trigger]
+    for chunk_count, end_idx in enumerate(triggers):
+        start_idx = end_idx - chunk_size
+        print(f"\n[帧 {end_idx}] 触发处理 Chunk {chunk_count}")
+        print(f"  - 范围: [{start_idx}:{end_idx}]")
+        print(f"  - 需要帧数: {end_idx}")
+        print(f"  - 当前总帧数: {end_idx}")
         
-        if total_frames >= required_frames:
-            # 计算chunk范围
-            if chunk_count == 0:
-                start_idx = 0
-                end_idx = chunk_size
-            else:
-                start_idx = processed_frames - overlap
-                end_idx = start_idx + chunk_size
-            
-            # 检查是否有足够的帧
-            if total_frames >= end_idx:
-                print(f"\n[帧 {total_frames}] 触发处理 Chunk {chunk_count}")
-                print(f"  - 范围: [{start_idx}:{end_idx}]")
-                print(f"  - 需要帧数: {required_frames}")
-                print(f"  - 当前总帧数: {total_frames}")
-                
-                # 更新状态
-                processed_frames = end_idx
-                chunk_count += 1
-                
-                # 计算下次触发时机
-                if chunk_count > 0:
-                    next_required = processed_frames - overlap + chunk_size
-                    print(f"  - 下次将在第 {next_required} 帧时处理")
+        # 计算下次触发时机
+        next_required = end_idx - overlap + chunk_size
+        print(f"  - 下次将在第 {next_required} 帧时处理")
     
     print("\n" + "=" * 60)
-    print(f"总共处理了 {chunk_count} 个chunk")
+    print(f"总共处理了 {len(triggers)} 个chunk")
     print("=" * 60)
 
 
@@ -64,20 +54,20 @@ def test_chunk_logic_detailed():
     print("详细测试: 显示关键帧的判断")
     print("=" * 60)
     
-    chunk_count = 0
-    processed_frames = 0
+    triggers = chunk_triggers(chunk_size, overlap, TOTAL_FRAMES)
+    trigger_set = set(triggers)
     
     # 只显示关键帧附近的情况
     key_frames = [118, 119, 120, 121, 178, 179, 180, 181, 238, 239, 240, 241]
     
-    for total_frames in range(1, 301):
-        # 检查是否应该处理chunk
-        if chunk_count == 0:
-            required_frames = chunk_size
-        else:
-            required_frames = processed_frames - overlap + chunk_size
+    # 只需评估关键帧和触发帧，其余帧的状态不变
+    for total_frames in sorted(trigger_set.union(key_frames)):
+        # 在该帧之前已处理的chunk数
+        chunk_count = sum(1 for trigger in triggers if trigger < total_frames)
+        processed_frames = triggers[chunk_count - 1] if chunk_count > 0 else 0
+        required_frames = chunk_size if chunk_count == 0 else processed_frames - overlap + chunk_size
         
-        should_process = total_frames >= required_frames
+        should_process = total_frames in trigger_set
         
         # 只显示关键帧
         if total_frames in key_frames:
@@ -86,21 +76,12 @@ def test_chunk_logic_detailed():
         
         # 实际处理
         if should_process:
-            if chunk_count == 0:
-                start_idx = 0
-                end_idx = chunk_size
+            start_idx = total_frames - chunk_size
+            end_idx = total_frames
+            if total_frames not in key_frames:
+                print(f"帧 {total_frames:3d}: 🎯 处理 Chunk {chunk_count} (范围: [{start_idx}:{end_idx}])")
             else:
-                start_idx = processed_frames - overlap
-                end_idx = start_idx + chunk_size
-            
-            if total_frames >= end_idx:
-                if total_frames not in key_frames:
-                    print(f"帧 {total_frames:3d}: 🎯 处理 Chunk {chunk_count} (范围: [{start_idx}:{end_idx}])")
-                else:
-                    print(f"    └─> 🎯 处理 Chunk {chunk_count} (范围: [{start_idx}:{end_idx}])")
-                
-                processed_frames = end_idx
-                chunk_count += 1
+                print(f"    └─> 🎯 处理 Chunk {chunk_count} (范围: [{start_idx}:{end_idx}])")
 
 
 if __name__ == '__main__':
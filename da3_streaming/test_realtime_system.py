@@ -4,13 +4,18 @@
 DA3实时系统测试脚本
 用于测试各个组件是否正常工作
 """
+import importlib.util
 import json
 import os
 import sys
 import time
 
-def check_dependencies():
-    """检查依赖是否安装"""
+def check_dependencies(deep_check=False):
+    """检查依赖是否安装
+    
+    默认只用 importlib.util.find_spec 确认模块可以找到（不执行模块代码，很快）；
+    deep_check=True 时实际导入每个模块，能发现二进制库缺失等导入期错误
+    """
     print("=" * 50)
     print("检查依赖...")
     print("=" * 50)
@@ -27,9 +32,17 @@ def check_dependencies():
     missing = []
     for module_name, package_name in required_packages:
         try:
-            __import__(module_name)
-            print(f"✓ {package_name} 已安装")
+            if deep_check:
+                __import__(module_name)
+                found = True
+            else:
+                found = importlib.util.find_spec(module_name) is not None
         except ImportError:
+            found = False
+        
+        if found:
+            print(f"✓ {package_name} 已安装")
+        else:
             print(f"✗ {package_name} 未安装")
             missing.append(package_name)
     
@@ -159,9 +172,13 @@ def test_zmq_connection(host='127.0.0.1', port=5555, timeout=2):
     
     try:
         import zmq
+        from loop_utils.zmq_utils import unpack_frame_message
         
         context = zmq.Context()
         socket = context.socket(zmq.SUB)
+        # 只保留最新的一条消息（多帧消息不支持ZMQ_CONFLATE，用RCVHWM=1代替），需在connect之前设置
+        socket.setsockopt(zmq.RCVHWM, 1)
+        socket.setsockopt(zmq.LINGER, 0)
         socket.connect(f"tcp://{host}:{port}")
         socket.setsockopt_string(zmq.SUBSCRIBE, "")
         socket.setsockopt(zmq.RCVTIMEO, timeout * 1000)
@@ -169,9 +186,12 @@ def test_zmq_connection(host='127.0.0.1', port=5555, timeout=2):
         print(f"正在等待消息 (超时 {timeout}s)...")
         
         try:
-            msg = socket.recv_string()
+            parts = socket.recv_multipart(copy=False)
             print("✓ 成功接收到ZMQ消息")
-            print(f"  - 消息长度: {len(msg)} bytes")
+            print(f"  - 消息长度: {sum(p.buffer.nbytes for p in parts)} bytes")
+            timestamp, jpeg = unpack_frame_message(parts)
+            print(f"  - 消息格式: {'[时间戳, JPEG] 多帧' if len(parts) > 1 else 'JSON+base64（旧格式）'}")
+            print(f"  - 时间戳: {timestamp}, JPEG: {len(jpeg)} bytes")
             socket.close()
             context.term()
             return True
@@ -228,7 +248,7 @@ def main():
     results = {}
     
     # 必须通过的测试
-    results['依赖检查'] = check_dependencies()
+    results['依赖检查'] = check_dependencies(deep_check='--deep-check' in sys.argv)
     results['权重检查'] = check_weights()
     results['配置检查'] = check_config()
     results['CUDA检查'] = check_cuda()
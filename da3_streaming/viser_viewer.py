@@ -12,11 +12,41 @@ from pathlib import Path
 import open3d as o3d
 import time
 import threading
+import heapq
+import math
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Rust 实现的 JSON 解析，比标准库快数倍；没有安装时用标准库
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_loads(data):
+        return json.loads(data.decode('utf-8'))
+
+try:
+    # 文件事件监听（inotify/FSEvents）；没有安装时退回定时轮询
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
 
 # 配置路径
 PLY_PATH = "/home/lh/projects/Depth-Anything-3/da3_streaming/video_output/pcd/combined_pcd.ply"
 JSON_PATH = ""
 
+# 每个浏览器同时显示的最大点数；点云超过该值时按八叉树分级加载
+MAX_POINTS = 500000
+
+# 八叉树分级加载（LOD）参数
+LOD_NODE_POINTS = 16384   # 每个八叉树节点保存的点数
+LOD_MAX_DEPTH = 10        # 最大深度，到达后剩余的点都留在该节点
+LOD_REFINE_ANGLE = 0.05   # 节点包围球的视角半径（弧度）大于该值时才加载子节点
+LOD_HIDDEN_POINTS = 2 * MAX_POINTS  # 每个浏览器中保留的已隐藏节点的总点数，超出时删除最久未显示的节点
+LOD_GRID_RESOLUTION = 128  # 节点内采样用的体素网格每边格数（表面上约 128^2 个非空体素）
+
 # 颜色映射（为不同的目标类型分配不同的颜色）
 OBJECT_COLORS = {
     "Keyboard": (255, 0, 0),      # 红色
@@ -29,6 +59,162 @@ OBJECT_COLORS = {
     "default": (255, 128, 0)      # 橙色（默认）
 }
 
+# 颜色查找表：类别名 -> 整数编号 -> (N, 3) uint8 颜色
+_COLOR_NAMES = list(OBJECT_COLORS)
+_NAME_TO_ID = {name: i for i, name in enumerate(_COLOR_NAMES)}
+_COLOR_LUT = np.array([OBJECT_COLORS[name] for name in _COLOR_NAMES], dtype=np.uint8)
+_DEFAULT_ID = _NAME_TO_ID["default"]
+
+# PLY 属性类型到 numpy 类型的映射
+PLY_DTYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+
+def _as_point_buffer(a, dtype):
+    """返回 (N, 3)、C 连续、指定类型的数组；已满足时原样返回
+    
+    viser 对这样的数组直接按原始字节序列化，列表或非连续/其他类型的数组会走慢得多的逐元素编码
+    """
+    if isinstance(a, np.ndarray) and a.dtype == dtype and a.flags['C_CONTIGUOUS'] and a.ndim == 2 and a.shape[1] == 3:
+        return a
+    return np.ascontiguousarray(a, dtype=dtype).reshape(-1, 3)
+
+
+def _grid_sample(points, origin, extent, max_points, rng):
+    """体素网格下采样：每个非空体素保留一个点，超过 max_points 时再随机截取
+    
+    与随机采样相比，稀疏区域的点不会被丢掉，密集区域也不会保留过多的点
+    
+    Returns:
+        被选中点的下标（升序）
+    """
+    grid = LOD_GRID_RESOLUTION
+    q = ((points - origin) * (grid / extent)).astype(np.int64)
+    np.clip(q, 0, grid - 1, out=q)
+    keys = (q[:, 0] * grid + q[:, 1]) * grid + q[:, 2]
+    _, first = np.unique(keys, return_index=True)
+    if len(first) > max_points:
+        first = rng.choice(first, max_points, replace=False, shuffle=False)
+    first.sort()
+    return first
+
+
+def _build_octree(points, node_points=LOD_NODE_POINTS, max_depth=LOD_MAX_DEPTH, rng=None):
+    """构建分层采样的八叉树（Potree 的做法）
+    
+    每个节点按体素网格保留最多 node_points 个点，其余的点按所在卦限分给子节点，
+    父子节点之间的点互不重复，所以同时显示多层节点不会重复绘制。
+    
+    Returns:
+        order: (N,) 重排下标，points[order] 中每个节点的点是连续的一段
+        nodes: dict，按广度优先编号（0 为根）的节点数组：
+            start/end (M,) 在重排后数组中的区间，center (M, 3)，radius (M,) 包围球半径，
+            children 每个节点的子节点编号列表
+    """
+    rng = rng or np.random.default_rng()
+    lo = points.min(axis=0).astype(np.float64)
+    hi = points.max(axis=0).astype(np.float64)
+    half = float((hi - lo).max()) / 2 + 1e-6
+    octant_weights = np.array([4, 2, 1])
+    
+    order_parts, starts, centers, halves, children = [], [], [], [], []
+    offset = 0
+    # 广度优先：父节点的编号总是小于子节点
+    queue = deque([(np.arange(len(points)), (lo + hi) / 2, half, 0, -1)])
+    while queue:
+        idx, center, half, depth, parent = queue.popleft()
+        node_id = len(starts)
+        if parent >= 0:
+            children[parent].append(node_id)
+        
+        if len(idx) <= node_points or depth >= max_depth:
+            keep, rest = idx, idx[:0]
+        else:
+            mask = np.zeros(len(idx), dtype=bool)
+            mask[_grid_sample(points[idx], center - half, 2 * half, node_points, rng)] = True
+            keep, rest = idx[mask], idx[~mask]
+        
+        order_parts.append(keep)
+        starts.append(offset)
+        centers.append(center)
+        halves.append(half)
+        children.append([])
+        offset += len(keep)
+        
+        if len(rest) == 0:
+            continue
+        # 按卦限分组（一次排序），非空的卦限成为子节点
+        octant = (points[rest] >= center) @ octant_weights
+        rest = rest[np.argsort(octant, kind='stable')]
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(octant, minlength=8))))
+        for o in range(8):
+            if bounds[o + 1] > bounds[o]:
+                sign = np.array([(o >> 2) & 1, (o >> 1) & 1, o & 1]) * 2 - 1
+                queue.append((rest[bounds[o]:bounds[o + 1]], center + sign * half / 2, half / 2, depth + 1, node_id))
+    
+    starts = np.asarray(starts, dtype=np.int64)
+    nodes = {
+        "start": starts,
+        "end": np.append(starts[1:], offset),
+        "center": np.asarray(centers, dtype=np.float64),
+        "radius": np.asarray(halves, dtype=np.float64) * math.sqrt(3),
+        "children": children,
+    }
+    return np.concatenate(order_parts), nodes
+
+
+def _read_ply_binary(path):
+    """直接读取 binary_little_endian PLY 的顶点数据（mmap，不经过 Open3D）
+    
+    Returns:
+        (points (N, 3), colors (N, 3) uint8 或 None)；
+        不支持的格式（ASCII/大端、顶点不是第一个元素、含列表属性）返回 None
+    """
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b"ply":
+            return None
+        fmt = None
+        elements = []  # [(name, count, [(prop_name, dtype)])]
+        for line in f:
+            tokens = line.split()
+            if not tokens or tokens[0] in (b"comment", b"obj_info"):
+                continue
+            if tokens[0] == b"format":
+                fmt = tokens[1].decode()
+            elif tokens[0] == b"element":
+                elements.append((tokens[1].decode(), int(tokens[2]), []))
+            elif tokens[0] == b"property":
+                if tokens[1] == b"list" or not elements:
+                    return None
+                ply_type = PLY_DTYPES.get(tokens[1].decode())
+                if ply_type is None:
+                    return None
+                elements[-1][2].append((tokens[2].decode(), "<" + ply_type))
+            elif tokens[0] == b"end_header":
+                break
+        header_end = f.tell()
+    
+    if fmt != "binary_little_endian" or not elements or elements[0][0] != "vertex":
+        return None
+    _, num_vertices, props = elements[0]
+    names = [name for name, _ in props]
+    if not {"x", "y", "z"}.issubset(names):
+        return None
+    
+    # 按文件中的属性顺序构造结构化类型，顶点数据整体映射为一个数组
+    vertices = np.memmap(path, dtype=np.dtype(props), mode='r', offset=header_end, shape=(num_vertices,))
+    points = np.stack([vertices['x'], vertices['y'], vertices['z']], axis=1)
+    colors = None
+    if {"red", "green", "blue"}.issubset(names):
+        colors = np.stack([vertices['red'], vertices['green'], vertices['blue']], axis=1)
+    del vertices
+    return points, colors
+
+
 class ViserPointCloudViewer:
     """Viser 点云查看器类"""
     
@@ -43,8 +229,37 @@ class ViserPointCloudViewer:
         # 数据存储
         self.points = None
         self.colors = None
+        # 点云数据的复用缓冲区，points/colors 是其中已填充部分的视图
+        self._pts_buf = np.empty((MAX_POINTS, 3), dtype=np.float32)
+        self._col_buf = np.empty((MAX_POINTS, 3), dtype=np.uint8)
         self.objects = []
-        self.last_json_mtime = 0
+        # 目标的列式数据（加载 JSON 时一次性解析），渲染时按下标读取
+        self._obj_names = []
+        self._obj_centers = np.empty((0, 3), dtype=np.float32)
+        self._obj_num_points = np.empty(0, dtype=np.int32)
+        self._obj_box_sizes = np.empty(0, dtype=np.float32)
+        self._obj_colors = np.empty((0, 3), dtype=np.uint8)
+        self._json_stat = None  # 已应用到场景的 JSON 的 (mtime_ns, size)，只由主线程修改
+        self._parsed_stat = None  # 后台线程上次解析的 (mtime_ns, size)
+        
+        # 场景节点句柄：显示开关和点大小直接修改节点属性，不重新发送点云数据
+        self.pcd_handle = None
+        self.grid_handle = None
+        self._obj_handles = {}  # 目标标识 -> {"node", "bbox", "label"}
+        # 目标节点的父节点：/objects 下分 bboxes、labels 两组，显示开关只切换组的 visible
+        self._objects_group = None
+        self._bbox_group = None
+        self._label_group = None
+        self.centers_handle = None  # 所有目标中心点组成的点云
+        self._centers_sent = None  # 上次发送的 (中心, 颜色) 数组
+        
+        # 八叉树分级加载：每个浏览器有自己的相机，节点句柄按客户端分别保存
+        self._lod = None
+        self._lod_clients = {}  # client_id -> ClientHandle
+        self._lod_handles = {}  # client_id -> {节点编号: 句柄}
+        self._lod_hidden = {}  # client_id -> 已隐藏节点的 LRU（OrderedDict 节点编号 -> 点数，最久的在前）
+        self._lod_lock = threading.Lock()
+        self._next_obj_node = 0
         
         # 控制参数
         self.show_point_cloud = True
@@ -54,6 +269,10 @@ class ViserPointCloudViewer:
         self.show_grid = True
         self.point_size = 0.002  # 从0.005改为0.002，更小
         self.auto_refresh = True
+        self._observer = None  # watchdog 文件监听器
+        # 后台读取解析 JSON 的线程和结果队列；场景只在主线程中更新
+        self._refresh_pool = ThreadPoolExecutor(max_workers=1)
+        self._scene_update_q = queue.Queue()
         
         # GUI 控件
         self.gui_elements = {}
@@ -65,24 +284,47 @@ class ViserPointCloudViewer:
         if not os.path.exists(self.ply_path):
             raise FileNotFoundError(f"点云文件不存在: {self.ply_path}")
         
-        # 使用 Open3D 加载点云
-        pcd = o3d.io.read_point_cloud(self.ply_path)
-        
-        # 获取点和颜色
-        self.points = np.asarray(pcd.points)
-        self.colors = np.asarray(pcd.colors) if pcd.has_colors() else None
-        
-        # 如果没有颜色信息，使用默认灰色
-        if self.colors is None:
-            self.colors = np.ones_like(self.points) * 0.5
-        
-        # 下采样点云（如果点太多）
-        max_points = 500000
-        if len(self.points) > max_points:
-            print(f"点云过大，进行下采样: {len(self.points)} -> {max_points}")
-            indices = np.random.choice(len(self.points), max_points, replace=False)
-            self.points = self.points[indices]
-            self.colors = self.colors[indices]
+        # 二进制小端PLY直接映射读取，其他格式交给 Open3D
+        result = _read_ply_binary(self.ply_path)
+        if result is not None:
+            points, colors = result
+        else:
+            pcd = o3d.io.read_point_cloud(self.ply_path)
+            
+            # 获取点和颜色（Open3D 的颜色为 [0, 1] 浮点数）
+            points = np.asarray(pcd.points)
+            colors = np.asarray(pcd.colors) if pcd.has_colors() else None
+        
+        # 点太多时构建八叉树，每个浏览器按自己的视角只加载可见的节点（总数不超过 MAX_POINTS），
+        # 近处保留完整精度；点数不多时整体作为一个节点发送
+        self._lod = None
+        if len(points) > MAX_POINTS:
+            print(f"点云较大（{len(points)} 个点），构建八叉树按视角分级加载")
+            order, self._lod = _build_octree(points)
+            points = points[order]
+            if colors is not None:
+                colors = colors[order]
+            print(f"八叉树节点数: {len(self._lod['start'])}")
+        
+        # 写入复用的 float32 坐标 / uint8 颜色缓冲区（只在点数超过容量时重新分配），
+        # self.points/self.colors 是其前 n 行的视图，之后每次发送给浏览器都直接复用
+        # 这里不做 GPU 版本：查看器对点云没有逐点计算，只是把缓冲区序列化后发给浏览器，
+        # 放到 CUDA 上只会多出设备与主机之间的拷贝
+        n = len(points)
+        if n > len(self._pts_buf):
+            self._pts_buf = np.empty((n, 3), dtype=np.float32)
+            self._col_buf = np.empty((n, 3), dtype=np.uint8)
+        self.points = self._pts_buf[:n]
+        self.colors = self._col_buf[:n]
+        self.points[:] = points
+        if colors is None:
+            # 没有颜色信息，使用默认灰色
+            self.colors.fill(128)
+        elif colors.dtype == np.uint8:
+            self.colors[:] = colors
+        else:
+            self.colors[:] = np.clip(colors * 255.0 + 0.5, 0, 255)
+        del points, colors
         
         print(f"点云加载完成: {len(self.points)} 个点")
         
@@ -93,99 +335,307 @@ class ViserPointCloudViewer:
             return []
         
         try:
-            # 检查文件修改时间
-            current_mtime = os.path.getmtime(self.json_path)
-            if current_mtime == self.last_json_mtime and self.objects:
-                return self.objects
-            
-            self.last_json_mtime = current_mtime
-            
-            with open(self.json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            self.objects = data.get('objects', [])
-            print(f"加载了 {len(self.objects)} 个目标对象")
+            result = self._read_objects_json(self._json_stat)
+            if result is not None:
+                self._parsed_stat = result[0]
+                self._apply_objects(result)
             return self.objects
         except Exception as e:
             print(f"加载 JSON 失败: {e}")
             return []
     
-    def get_object_color(self, object_name):
-        """获取目标对象的颜色"""
-        return OBJECT_COLORS.get(object_name, OBJECT_COLORS["default"])
+    def _read_objects_json(self, last_stat):
+        """读取并解析 JSON（可以在工作线程中调用：不修改查看器状态，也不访问 viser）
+        
+        Args:
+            last_stat: 上次解析时的 (mtime_ns, size)，与当前相同时不解析；None 表示总是解析
+        
+        Returns:
+            (stat, objects, columns)；文件修改时间和大小未变化时返回 None
+        """
+        # 检查文件修改时间和大小，未变化时不重新解析
+        current_stat = self._get_json_stat()
+        if current_stat == last_stat:
+            return None
+        
+        # 以二进制整体读入后直接解析，不经过文本解码
+        with open(self.json_path, 'rb') as f:
+            data = _json_loads(f.read())
+        
+        objects = data.get('objects', [])
+        return current_stat, objects, self._object_columns(objects)
+    
+    def _apply_objects(self, result):
+        """保存 _read_objects_json 的结果"""
+        self._json_stat, self.objects, columns = result
+        (self._obj_names, self._obj_centers, self._obj_num_points,
+         self._obj_box_sizes, self._obj_colors) = columns
+        print(f"加载了 {len(self.objects)} 个目标对象")
+    
+    @staticmethod
+    def _object_columns(objs):
+        """把目标列表解析成 NumPy 列：名称、中心 (N, 3) float32、点数、边界框边长、颜色 (N, 3) uint8"""
+        names = [o.get('object_name', 'Unknown') for o in objs]
+        centers = [o.get('center', {}) for o in objs]
+        centers = np.fromiter(
+            (c.get(axis, 0) for c in centers for axis in ('x', 'y', 'z')),
+            dtype=np.float32, count=3 * len(objs)).reshape(-1, 3)
+        num_points = np.fromiter(
+            (o.get('num_points', 0) for o in objs), dtype=np.int32, count=len(objs))
+        # 根据点数估算边界框大小
+        box_sizes = np.clip(np.cbrt(num_points / 10000.0) * 0.3, 0.1, 0.5).astype(np.float32)
+        # 按类别编号从查找表中一次取出所有颜色
+        ids = np.fromiter(
+            (_NAME_TO_ID.get(name, _DEFAULT_ID) for name in names),
+            dtype=np.int32, count=len(objs))
+        return names, centers, num_points, box_sizes, _COLOR_LUT[ids]
+    
+    def _get_json_stat(self):
+        """JSON 文件的 (mtime_ns, size)；用纳秒整数比较，避免浮点秒的精度问题"""
+        st = os.stat(self.json_path)
+        return st.st_mtime_ns, st.st_size
+    
+    def json_changed(self):
+        """JSON 文件自上次加载后是否有变化（只做一次 stat）"""
+        try:
+            return self._get_json_stat() != self._json_stat
+        except OSError:
+            return False
     
     def render_point_cloud(self):
         """渲染点云"""
-        if self.points is None or not self.show_point_cloud:
+        if self.points is None:
+            return
+        # 发送前确认数据布局，不满足时转换一次并保存结果
+        self.points = _as_point_buffer(self.points, np.float32)
+        self.colors = _as_point_buffer(self.colors, np.uint8)
+        if self._lod is not None:
+            # 分级加载：节点在各客户端的相机更新时按需添加
+            self.server.on_client_connect(self._on_lod_client_connect)
+            self.server.on_client_disconnect(self._on_lod_client_disconnect)
             return
         
+        # 隐藏时也添加节点，之后显示开关只切换 visible，不再重新上传点云
         try:
-            self.server.scene.add_point_cloud(
+            self.pcd_handle = self.server.scene.add_point_cloud(
                 name="/point_cloud",
                 points=self.points,
                 colors=self.colors,
                 point_size=self.point_size,
+                visible=self.show_point_cloud,
             )
         except Exception as e:
             print(f"渲染点云失败: {e}")
     
-    def render_objects(self):
-        """渲染目标对象标注"""
-        if not self.show_objects:
-            return
+    def _on_lod_client_connect(self, client):
+        with self._lod_lock:
+            self._lod_clients[client.client_id] = client
+            self._lod_handles[client.client_id] = {}
+            self._lod_hidden[client.client_id] = OrderedDict()
         
-        # 清除旧的对象标注
-        for idx in range(len(self.objects)):
-            try:
-                self.server.scene.remove(f"/object_{idx}/center")
-                self.server.scene.remove(f"/object_{idx}/bbox")
-                self.server.scene.remove(f"/object_{idx}/label")
-            except:
-                pass
-        
-        # 添加新的对象标注
-        for idx, obj in enumerate(self.objects):
-            object_name = obj.get('object_name', 'Unknown')
-            center = obj.get('center', {})
-            cx = center.get('x', 0)
-            cy = center.get('y', 0)
-            cz = center.get('z', 0)
-            num_points = obj.get('num_points', 0)
-            timestamp = obj.get('timestamp', 'N/A')
-            
-            # 获取颜色
-            color = self.get_object_color(object_name)
-            
-            # 添加球体标记中心点（更小的标注点）
-            self.server.scene.add_icosphere(
-                name=f"/object_{idx}/center",
-                radius=0.02,  # 从0.05改为0.02，更小
-                color=color,
-                position=(cx, cy, cz),
-            )
-            
-            # 根据点数估算边界框大小
-            box_size = (num_points / 10000) ** (1/3) * 0.3
-            box_size = max(0.1, min(box_size, 0.5))
+        @client.camera.on_update
+        def _(_):
+            self.update_lod(client)
+        
+        # viser 在连接回调返回前就处理了第一次相机消息，上面的回调收不到它，这里先按当前相机加载一次
+        self.update_lod(client)
+    
+    def _on_lod_client_disconnect(self, client):
+        with self._lod_lock:
+            self._lod_clients.pop(client.client_id, None)
+            self._lod_handles.pop(client.client_id, None)
+            self._lod_hidden.pop(client.client_id, None)
+    
+    def _select_lod_nodes(self, camera):
+        """按相机选择要显示的八叉树节点
+        
+        从根节点开始按视角大小优先展开：视锥外的节点跳过，视角半径足够大的节点才继续加载子节点，
+        总点数不超过 MAX_POINTS
+        """
+        lod = self._lod
+        position = np.asarray(camera.position, dtype=np.float64)
+        forward = np.asarray(camera.look_at, dtype=np.float64) - position
+        forward /= max(np.linalg.norm(forward), 1e-9)
+        # 用圆锥近似视锥：半角取到画面对角
+        half_fov = math.atan(math.tan(camera.fov / 2) * math.sqrt(1 + camera.aspect ** 2))
+        
+        offsets = lod["center"] - position
+        dist = np.maximum(np.linalg.norm(offsets, axis=1), 1e-9)
+        angular_radius = np.arcsin(np.minimum(lod["radius"] / dist, 1.0))
+        angle = np.arccos(np.clip(offsets @ forward / dist, -1.0, 1.0))
+        in_view = angle <= half_fov + angular_radius
+        
+        counts = lod["end"] - lod["start"]
+        budget = MAX_POINTS
+        selected = set()
+        heap = [(-angular_radius[0], 0)]  # 根节点总是显示
+        while heap:
+            neg_size, node_id = heapq.heappop(heap)
+            if counts[node_id] > budget:
+                continue
+            budget -= counts[node_id]
+            selected.add(node_id)
+            if -neg_size < LOD_REFINE_ANGLE:
+                continue
+            for child in lod["children"][node_id]:
+                if in_view[child]:
+                    heapq.heappush(heap, (-angular_radius[child], child))
+        return selected
+    
+    def update_lod(self, client):
+        """根据客户端当前相机更新显示的节点
+        
+        新节点添加一次，之后只切换 visible；隐藏的节点按 LRU 保留，
+        总点数超过 LOD_HIDDEN_POINTS 时删除最久未显示的，浏览器中的数据量保持有界
+        """
+        with self._lod_lock:
+            handles = self._lod_handles.get(client.client_id)
+            if handles is None:
+                return
+            hidden = self._lod_hidden[client.client_id]
+            selected = self._select_lod_nodes(client.camera) if self.show_point_cloud else set()
+            for node_id, handle in handles.items():
+                visible = node_id in selected
+                if visible:
+                    hidden.pop(node_id, None)
+                elif node_id not in hidden:
+                    hidden[node_id] = int(self._lod["end"][node_id] - self._lod["start"][node_id])
+                if handle.visible != visible:
+                    handle.visible = visible
             
-            # 添加边界框
-            if self.show_bbox:
-                self.server.scene.add_box(
-                    name=f"/object_{idx}/bbox",
-                    dimensions=(box_size, box_size, box_size),
-                    color=color,
-                    position=(cx, cy, cz),
-                    wireframe=True,
+            hidden_points = sum(hidden.values())
+            while hidden_points > LOD_HIDDEN_POINTS:
+                node_id, count = hidden.popitem(last=False)
+                handles.pop(node_id).remove()
+                hidden_points -= count
+            for node_id in selected - handles.keys():
+                start, end = self._lod["start"][node_id], self._lod["end"][node_id]
+                handles[node_id] = client.scene.add_point_cloud(
+                    name=f"/lod/{node_id}",
+                    points=self.points[start:end],
+                    colors=self.colors[start:end],
+                    point_size=self.point_size,
                 )
+    
+    def _update_all_lod(self):
+        for client in list(self._lod_clients.values()):
+            self.update_lod(client)
+    
+    @staticmethod
+    def _object_key(obj):
+        """目标的稳定标识：优先用 id，否则用名称 + 取整后的中心坐标"""
+        if obj.get('id') is not None:
+            return str(obj['id'])
+        center = obj.get('center', {})
+        return "{}@{:.3f},{:.3f},{:.3f}".format(
+            obj.get('object_name', 'Unknown'), center.get('x', 0), center.get('y', 0), center.get('z', 0))
+    
+    def create_object_groups(self):
+        """创建目标标注的分组节点"""
+        self._objects_group = self.server.scene.add_frame(
+            "/objects", show_axes=False, visible=self.show_objects)
+        self._bbox_group = self.server.scene.add_frame(
+            "/objects/bboxes", show_axes=False, visible=self.show_bbox)
+        self._label_group = self.server.scene.add_frame(
+            "/objects/labels", show_axes=False, visible=self.show_labels)
+    
+    def _remove_object_nodes(self, key):
+        """删除一个目标的全部场景节点"""
+        handles = self._obj_handles.pop(key)
+        handles["bbox"].remove()
+        handles["label"].remove()
+    
+    def render_objects(self):
+        """渲染目标对象标注
+        
+        与上一次渲染的结果做差分：只删除消失的目标、添加新目标，
+        已有目标只更新位置/文字等属性，不重建节点。
+        边界框和标签总是创建在各自的分组下，显示与否由分组节点的 visible 决定
+        """
+        # 当前应显示的目标（重复的标识加序号区分）-> 在列式数据中的下标
+        targets = {}
+        for i, obj in enumerate(self.objects):
+            key = self._object_key(obj)
+            while key in targets:
+                key += "#"
+            targets[key] = i
+        
+        # 删除已经不存在的目标
+        for key in [key for key in self._obj_handles if key not in targets]:
+            self._remove_object_nodes(key)
+        
+        # 几何量一次性转成 Python 元组列表，循环里只剩节点属性的赋值；
+        # 坐标保留4位小数，上游的浮点抖动不会被当成移动
+        centers = self._obj_centers
+        rounded = np.round(centers.astype(np.float64), 4)
+        center_list = rounded.tolist()
+        label_list = np.round(rounded + [0, 0, 0.08], 4).tolist()  # 调整标签位置
+        box_sizes = np.round(self._obj_box_sizes.astype(np.float64), 4).tolist()
+        color_list = self._obj_colors.tolist()
+        
+        for key, i in targets.items():
+            object_name = self._obj_names[i]
+            position = tuple(center_list[i])
+            box_size = box_sizes[i]
+            color = tuple(color_list[i])
+            label_position = tuple(label_list[i])
             
-            # 添加文本标签（只显示目标名称）
-            if self.show_labels:
-                label_text = object_name  # 只显示名称
-                self.server.scene.add_label(
-                    name=f"/object_{idx}/label",
-                    text=label_text,
-                    position=(cx, cy, cz + 0.08),  # 调整标签位置
-                )
+            handles = self._obj_handles.get(key)
+            if handles is None:
+                # 新目标：分配一个节点编号，添加边界框和文本标签（只显示目标名称）
+                node = self._next_obj_node
+                self._next_obj_node += 1
+                self._obj_handles[key] = {
+                    "node": node,
+                    "sent": (position, box_size, color, object_name),  # 上次发送的属性
+                    "bbox": self.server.scene.add_box(
+                        name=f"/objects/bboxes/{node}",
+                        dimensions=(box_size, box_size, box_size),
+                        color=color,
+                        position=position,
+                        wireframe=True,
+                    ),
+                    "label": self.server.scene.add_label(
+                        name=f"/objects/labels/{node}",
+                        text=object_name,
+                        position=label_position,
+                    ),
+                }
+                continue
+            
+            # 只发送有变化的属性，目标都没变时刷新不产生任何消息
+            sent_position, sent_box_size, sent_color, sent_name = handles["sent"]
+            if position != sent_position:
+                handles["bbox"].position = position
+                handles["label"].position = label_position
+            if box_size != sent_box_size:
+                handles["bbox"].dimensions = (box_size, box_size, box_size)
+            if color != sent_color:
+                handles["bbox"].color = color
+            if object_name != sent_name:
+                handles["label"].text = object_name
+            handles["sent"] = (position, box_size, color, object_name)
+        
+        # 所有目标中心点合成一个点云节点（一条消息、一次绘制），不再每个目标一个球体
+        if len(targets) > 0:
+            if (self.centers_handle is not None and np.array_equal(self._centers_sent[0], centers)
+                    and np.array_equal(self._centers_sent[1], self._obj_colors)):
+                return
+            self._centers_sent = (centers, self._obj_colors)
+            self.centers_handle = self.server.scene.add_point_cloud(
+                name="/objects/centers",
+                points=centers,
+                colors=self._obj_colors,
+                point_size=0.04,  # 与原来半径0.02的球体大小一致
+            )
+        else:
+            self._remove_object_centers()
+    
+    def _remove_object_centers(self):
+        if self.centers_handle is not None:
+            self.centers_handle.remove()
+            self.centers_handle = None
+            self._centers_sent = None
     
     def setup_gui(self):
         """设置GUI控制面板"""
@@ -250,7 +700,7 @@ class ViserPointCloudViewer:
             
             # 自动刷新开关
             self.gui_elements['auto_refresh'] = self.server.gui.add_checkbox(
-                "自动刷新 (5秒)",
+                "自动刷新",
                 initial_value=self.auto_refresh
             )
         
@@ -258,61 +708,54 @@ class ViserPointCloudViewer:
         @self.gui_elements['show_pcd'].on_update
         def _(_):
             self.show_point_cloud = self.gui_elements['show_pcd'].value
-            if self.show_point_cloud:
-                self.render_point_cloud()
-            else:
-                try:
-                    self.server.scene.remove("/point_cloud")
-                except:
-                    pass
+            if self._lod is not None:
+                self._update_all_lod()
+            elif self.pcd_handle is not None:
+                self.pcd_handle.visible = self.show_point_cloud
         
         @self.gui_elements['point_size'].on_update
         def _(_):
             self.point_size = self.gui_elements['point_size'].value
-            if self.show_point_cloud:
-                self.render_point_cloud()
+            # 只更新点大小属性（一条很小的消息），不重新上传点云
+            if self.pcd_handle is not None:
+                self.pcd_handle.point_size = self.point_size
+            with self._lod_lock:
+                for handles in self._lod_handles.values():
+                    for handle in handles.values():
+                        handle.point_size = self.point_size
         
         @self.gui_elements['show_objects'].on_update
         def _(_):
             self.show_objects = self.gui_elements['show_objects'].value
-            self.render_objects()
+            self._objects_group.visible = self.show_objects
         
         @self.gui_elements['show_bbox'].on_update
         def _(_):
             self.show_bbox = self.gui_elements['show_bbox'].value
-            self.render_objects()
+            self._bbox_group.visible = self.show_bbox
         
         @self.gui_elements['show_labels'].on_update
         def _(_):
             self.show_labels = self.gui_elements['show_labels'].value
-            self.render_objects()
+            self._label_group.visible = self.show_labels
         
         @self.gui_elements['show_grid'].on_update
         def _(_):
             self.show_grid = self.gui_elements['show_grid'].value
-            if self.show_grid:
-                self.render_grid()
-            else:
-                try:
-                    self.server.scene.remove("/grid")
-                except:
-                    pass
+            self.grid_handle.visible = self.show_grid
         
         @self.gui_elements['refresh_btn'].on_click
         def _(_):
             print("手动刷新数据...")
-            self.refresh_data()
+            self.refresh_data(force=True)
         
         @self.gui_elements['auto_refresh'].on_update
         def _(_):
             self.auto_refresh = self.gui_elements['auto_refresh'].value
     
     def render_grid(self):
-        """渲染网格"""
-        if not self.show_grid:
-            return
-        
-        self.server.scene.add_grid(
+        """渲染网格（只添加一次，显示开关切换 visible）"""
+        self.grid_handle = self.server.scene.add_grid(
             name="/grid",
             width=10.0,
             height=10.0,
@@ -322,6 +765,7 @@ class ViserPointCloudViewer:
             cell_color=(200, 200, 200),
             cell_thickness=1.0,
             cell_size=0.5,
+            visible=self.show_grid,
         )
     
     def render_coordinate_frame(self):
@@ -332,10 +776,55 @@ class ViserPointCloudViewer:
             axes_radius=0.01,
         )
     
-    def refresh_data(self):
-        """刷新数据"""
-        # 重新加载对象
-        self.load_objects_json()
+    def refresh_data(self, force=False):
+        """刷新数据
+        
+        JSON 的读取和解析在后台线程中进行，结果放入队列，
+        由主线程（flush_scene_updates）更新场景，不阻塞 viser 的回调
+        
+        Args:
+            force: 即使 JSON 文件没有变化也重新加载和渲染
+        """
+        # 文件没有变化时不解析、不重新渲染
+        if not force and not self.json_changed():
+            return
+        self._refresh_pool.submit(self._load_for_refresh, force)
+    
+    def _load_for_refresh(self, force):
+        """后台线程：读取解析 JSON，结果交给主线程
+        
+        与上次解析的 stat 比较（_parsed_stat 只在这个线程中读写），主线程应用结果之前
+        连续到达的多个文件事件不会重复解析同一份内容；_json_stat 只由主线程修改
+        """
+        if not os.path.exists(self.json_path):
+            print(f"警告: JSON 文件不存在: {self.json_path}")
+            return
+        try:
+            result = self._read_objects_json(None if force else self._parsed_stat)
+        except Exception as e:
+            print(f"加载 JSON 失败: {e}")
+            return
+        if result is not None:
+            self._parsed_stat = result[0]
+            self._scene_update_q.put(result)
+    
+    def flush_scene_updates(self, timeout=None):
+        """在主线程中应用后台解析的结果（有多个时只用最新的一个）
+        
+        Args:
+            timeout: 队列为空时最多等待的秒数，None 表示不等待
+        """
+        try:
+            result = self._scene_update_q.get(timeout=timeout) if timeout else self._scene_update_q.get_nowait()
+        except queue.Empty:
+            return
+        while True:
+            try:
+                result = self._scene_update_q.get_nowait()
+            except queue.Empty:
+                break
+        
+        self._apply_objects(result)
         
         # 更新GUI信息
         if 'obj_count' in self.gui_elements:
@@ -346,11 +835,57 @@ class ViserPointCloudViewer:
         
         print(f"数据已刷新 - 当前有 {len(self.objects)} 个目标对象")
     
+    def _on_json_event(self, event):
+        """watchdog 回调：只处理目标 JSON 文件的事件（含写临时文件再改名的情况）"""
+        paths = (event.src_path, getattr(event, 'dest_path', None))
+        if self._json_abspath not in paths or not self.auto_refresh:
+            return
+        # 没有浏览器连接时不刷新，客户端连接时再补一次
+        if not self.server.get_clients():
+            return
+        try:
+            self.refresh_data()
+        except Exception as e:
+            print(f"自动刷新失败: {e}")
+    
+    def start_auto_refresh(self):
+        """启动自动刷新
+        
+        优先监听 JSON 所在目录的文件事件，文件变化时立即刷新、空闲时不占CPU；
+        没有 watchdog 或目录不存在（如网络文件系统不支持事件）时退回每5秒轮询
+        """
+        self._json_abspath = os.path.abspath(self.json_path)
+        self.server.on_client_connect(self._on_refresh_client_connect)
+        watch_dir = os.path.dirname(self._json_abspath)
+        if Observer is not None and os.path.isdir(watch_dir):
+            handler = FileSystemEventHandler()
+            handler.on_any_event = self._on_json_event
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.schedule(handler, watch_dir, recursive=False)
+            self._observer.start()
+            print(f"监听文件变化: {self._json_abspath}")
+            return
+        
+        print("未使用文件监听（未安装 watchdog 或目录不存在），每5秒轮询一次")
+        refresh_thread = threading.Thread(target=self.auto_refresh_loop, daemon=True)
+        refresh_thread.start()
+    
+    def _on_refresh_client_connect(self, client):
+        """新客户端连接时立即刷新一次，让它看到 JSON 的最新内容"""
+        if not self.auto_refresh:
+            return
+        try:
+            self.refresh_data()
+        except Exception as e:
+            print(f"自动刷新失败: {e}")
+    
     def auto_refresh_loop(self):
-        """自动刷新循环"""
+        """自动刷新循环（没有文件事件时的轮询后备）"""
         while True:
             time.sleep(5)  # 每5秒检查一次
-            if self.auto_refresh:
+            # 没有浏览器连接时什么都不做
+            if self.auto_refresh and self.server.get_clients():
                 try:
                     self.refresh_data()
                 except Exception as e:
@@ -375,6 +910,7 @@ class ViserPointCloudViewer:
         # 渲染场景
         print("\n正在渲染场景...")
         self.render_point_cloud()
+        self.create_object_groups()
         self.render_objects()
         self.render_grid()
         self.render_coordinate_frame()
@@ -383,9 +919,8 @@ class ViserPointCloudViewer:
         print("正在设置控制面板...")
         self.setup_gui()
         
-        # 启动自动刷新线程
-        refresh_thread = threading.Thread(target=self.auto_refresh_loop, daemon=True)
-        refresh_thread.start()
+        # 启动自动刷新
+        self.start_auto_refresh()
         
         print("\n" + "=" * 60)
         print("✅ 可视化准备完成！")
@@ -395,15 +930,21 @@ class ViserPointCloudViewer:
         print("=" * 60)
         print("\n功能说明:")
         print("  • 左侧面板可以控制显示选项")
-        print("  • 支持自动刷新 object.json (每5秒)")
+        print("  • 支持自动刷新 object.json (文件变化时立即刷新)")
         print("  • 点击'刷新数据'按钮手动刷新")
         print("\n按 Ctrl+C 退出...")
         
-        # 保持服务器运行
+        # 保持服务器运行，同时应用后台刷新的结果
         try:
             while True:
-                time.sleep(1)
+                try:
+                    self.flush_scene_updates(timeout=1.0)
+                except Exception as e:
+                    print(f"自动刷新失败: {e}")
         except KeyboardInterrupt:
+            if self._observer is not None:
+                self._observer.stop()
+            self._refresh_pool.shutdown(wait=False)
             print("\n\n👋 服务器已关闭")
 
 def main():